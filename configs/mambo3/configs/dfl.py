@@ -1,47 +1,62 @@
-SW_NAME = "BUOY_CONTROLLER_ASYNC"
-SW_VERSION = "v1"
-RESET_CAUSE = ("SOFT_RESET","PWRON_RESET","HARD_RESET","WDT_RESET","DEEPSLEEP_RESET")
-CONFIG_DIR = "configs/"
-CONFIG_TYPE = ".json"
-LOG_DIR = "/sd/log"
-LOG_FILE = "syslog"
-LOG_LINES = 50
-ESC_CHAR = "#"
-PASSWD = "ogsp4lme"
-LOGIN_ATTEMPTS = 3
-SESSION_TIMEOUT = 120   # sec.
-DEVS = (
-    None,
-    None,
-    None,
-    None,
-    None,
-    None,
-    "dev_modem.MODEM",
-    "dev_board.SYSMON"
-    )  # Ordered as bob ports
-UARTS = (
-    2,
-    4,
-    None,
-    6,
-    1,
-    2,
-    3
-    )    # Ordered as bob ports.
-CTRL_PINS = (
-    "X12",
-    "Y6",
-    "Y4",
-    "Y3",
-    "X11",
-    "Y7",
-    "Y5"
-    )    # Ordered as bob ports.
-WD_TIMEOUT = 30000  # 1000ms < watchdog timer timeout < 32000ms
-DATA_DIR = "/sd/data"
-BKP_FILE_PFX = "."
-TMP_FILE_PFX = "$"
-SENT_FILE_PFX = "#"
-DATA_SEPARATOR = ","
-STATUS = ("off","on","run_until_expire","run_until_complete")
+SW_NAME = "BUOY_CONTROLLER_ASYNC"
+SW_VERSION = "v1"
+RESET_CAUSE = ("SOFT_RESET","PWRON_RESET","HARD_RESET","WDT_RESET","DEEPSLEEP_RESET")
+CONFIG_DIR = "configs/"
+CONFIG_TYPE = ".json"
+LOG_DIR = "/sd/log"
+LOG_FILE = "syslog"
+LOG_LINES = 50
+ESC_CHAR = "#"
+PASSWD = "ogsp4lme"
+LOGIN_ATTEMPTS = 3
+SESSION_TIMEOUT = 120   # sec.
+DEVS = (
+    None,
+    None,
+    None,
+    None,
+    None,
+    None,
+    "dev_modem.MODEM",
+    "dev_board.SYSMON"
+    )  # Ordered as bob ports
+UARTS = (
+    2,
+    4,
+    None,
+    6,
+    1,
+    2,
+    3
+    )    # Ordered as bob ports.
+CTRL_PINS = (
+    "X12",
+    "Y6",
+    "Y4",
+    "Y3",
+    "X11",
+    "Y7",
+    "Y5"
+    )    # Ordered as bob ports.
+WD_TIMEOUT = 30000  # 1000ms < watchdog timer timeout < 32000ms
+DATA_DIR = "/sd/data"
+BKP_FILE_PFX = "."
+TMP_FILE_PFX = "$"
+SENT_FILE_PFX = "#"
+DATA_SEPARATOR = ","
+STATUS = ("off","on","run_until_expire","run_until_complete")
+DATA_BUF_LEN = 4096  # Data sink ram buffer [bytes].
+DATA_FLUSH_LEN = 2048  # Buffered bytes triggering a write out.
+DATA_FLUSH_INTERVAL = 60  # Max age of buffered data [sec].
+SD_SECTOR = 512  # Sd card sector size [bytes].
+BIN_FILE_SFX = ".bin"  # Binary data files suffix.
+INDEX_FILE_SFX = ".idx"  # Data files index suffix.
+INDEX_BUCKET = 600  # Data files index time resolution [sec].
+DATA_JOURNAL = True  # Journals data appends.
+JOURNAL_FILE_SFX = ".jrn"  # Data files journal suffix.
+JOURNAL_LEN = 8192  # Journal size [bytes].
+BAD_FILE_SFX = ".bad"  # Suffix of the journals failing to replay, kept for recovery by hand.
+INVENTORY_FILE = "/sd/inventory.json"  # Persisted data files catalog, None keeps it in ram only.
+EXECUTOR_WORKERS = 2  # Threads running blocking file io.
+EXECUTOR_JOBS = 8  # Max queued blocking jobs.
+WRITE_BUF_LEN = 256  # Coalesced small uart writes [bytes].
@@ -1,248 +1,315 @@
-# dev_modem.py
-# MIT license; Copyright (c) 2020 Andrea Corbo
-#"Init_Ats":["ATE1\r","ATI\r","AT+CREG=0\r","AT+CSQ\r","AT+CBST=7,0,1\r","AT+COPS=1,2,22201\r","ATS0=1\r","AT&W\r"],
-import uasyncio as asyncio
-from primitives.semaphore import Semaphore
-import time
-from tools.utils import log, verbose, files_to_send, disconnect, trigger
-from configs import dfl, cfg
-from device import DEVICE
-from tools.ymodem import YMODEM
-
-class MODEM(DEVICE, YMODEM):
-
-    def __init__(self):
-        DEVICE.__init__(self)
-        self.sreader = asyncio.StreamReader(self.uart)
-        self.swriter = asyncio.StreamWriter(self.uart, {})
-        self.data = b''
-        self.semaphore = Semaphore()  # Data/Sms semaphore.
-        self.disconnect = disconnect
-        self.at_timeout = self.config['Modem']['At_Timeout']
-        self.init_ats = self.config['Modem']['Init_Ats']
-        self.init_timeout = self.config['Modem']['Init_Timeout']
-        self.call_ats = self.config['Modem']['Call_Ats']
-        self.hangup_ats = self.config['Modem']['Hangup_Ats']
-        self.at_delay = self.config['Modem']['At_Delay']
-        self.call_attempt = self.config['Modem']['Call_Attempt']
-        self.call_delay = self.config['Modem']['Call_Delay']
-        self.call_timeout = self.config['Modem']['Call_Timeout']
-        self.ymodem_delay = self.config['Modem']['Ymodem_Delay']
-        self.keep_alive = self.config['Modem']['Keep_Alive']
-        self.sms_ats1 = self.config['Modem']['Sms_Ats1']
-        self.sms_ats2 = self.config['Modem']['Sms_Ats2']
-        self.sms_timeout = self.config['Modem']['Sms_Timeout']
-        self.trigger = trigger
-        YMODEM.__init__(self, self.agetc, self.aputc)
-
-    async def startup(self, **kwargs):
-        self.on()
-        self.init_uart()
-        if await self.is_ready():
-            await self.init()
-        self.disconnect.set()
-
-    def decode(self):
-        try:
-            return self.data.decode('utf-8')
-        except UnicodeError:
-            log(self.__qualname__, 'communication error')
-            return False
-
-    # Captures commands replies.
-    async def reply(self):
-        self.data = b''
-        try:
-            self.data = await asyncio.wait_for(self.sreader.readline(), self.reply_timeout)
-            if self.decode():
-                return True
-        except asyncio.TimeoutError:
-            log(self.__qualname__, 'no answer')
-        return False
-
-    # Sends ats commands.
-    async def cmd(self, cmd):
-        await self.swriter.awrite(cmd)
-        while await self.reply():
-            verbose(self.data)
-            if (self.data.startswith(b'OK')
-                or self.data.startswith(b'ERROR')
-                or self.data.startswith(b'NO CARRIER')
-                or self.data.startswith(b'NO ANSWER')
-                or self.data.startswith(b'CONNECT')
-                ):
-                return True
-            await asyncio.sleep_ms(10)
-        return False
-
-    # Waits for modem getting ready.
-    async def is_ready(self):
-        self.reply_timeout = self.at_timeout
-        t0 = time.time()
-        while time.time() - t0 < self.init_timeout:
-            if await self.cmd('AT\r'):
-                if self.data.startswith(b'OK'):
-                    return True
-            await asyncio.sleep_ms(100)
-        log(self.__qualname__, 'not ready')
-        return False
-
-    # Sends initialisation cmds.
-    async def init(self):
-        self.reply_timeout = self.at_timeout
-        for at in self.init_ats:
-            while True:
-                if await self.cmd(at):
-                    if self.data.startswith(b'OK'):
-                        break
-                    elif self.data.startswith(b'ERROR'):
-                        await asyncio.sleep(self.at_delay)
-                        continue
-                log(self.__qualname__, 'initialisation failed')
-                return
-            await asyncio.sleep(self.at_delay)
-        log(self.__qualname__, 'successfully initialised')
-
-    async def agetc(self, size, timeout=1):
-        try:
-            return await asyncio.wait_for(self.sreader.readexactly(size), timeout)
-        except asyncio.TimeoutError:
-            return False
-
-    # Sends n-bytes.
-    async def aputc(self, data, timeout=1):
-        try:
-            await asyncio.wait_for(self.swriter.awrite(data), timeout)
-        except asyncio.TimeoutError:
-            return 0
-        return len(data)
-
-    # Make a call.
-    async def call(self):
-        self.reply_timeout = self.call_timeout  # Takes in account the real call timeout.
-        log(self.__qualname__, 'calling...')
-        for at in self.call_ats:
-            if await self.cmd(at):
-                if self.data.startswith(b'CONNECT'):
-                    #await self.sreader.read(1)  # Clears last byte.
-                    return True
-            await asyncio.sleep(self.at_delay)
-        log(self.__qualname__, 'call failed')
-        return False
-
-    # hangs a call.
-    async def hangup(self):
-        self.reply_timeout = self.at_timeout
-        log(self.__qualname__, 'hangup...')
-        for at in self.hangup_ats:
-            if await self.cmd(at):
-                if self.data.startswith(b'OK'):
-                    await asyncio.sleep(self.at_delay)
-                    continue
-            log(self.__qualname__, 'hangup failed')
-            return False
-        return True
-
-    # Tells to remote who it is.
-    async def preamble(self, retry=10, timeout=10):
-        #await asyncio.sleep(2)  # Safely waits for remote getting ready.
-        ec = 0  # Error counter.
-        while ec < retry:
-            if await self.aputc(cfg.HOSTNAME.lower()):
-                verbose(cfg.HOSTNAME.lower() +' -->')
-                try:
-                    res = await asyncio.wait_for(self.sreader.readexactly(1), timeout)
-                    if res == b'\x06':  # ACK
-                        verbose('<-- ACK')
-                        return True
-                    else:
-                        ec += 1
-                except asyncio.TimeoutError:
-                    ec += 1
-            await asyncio.sleep(1)
-        return False
-
-    # Sends and receives data.
-    async def datacall(self):
-        self.trigger.set(False)
-        async with self.semaphore:
-            #self.disconnect.clear()  # Locks user interaction.
-            self.init_uart()
-            ca = 0  # Attempts counter.
-            for _ in range(self.call_attempt):
-                ca += 1
-                if await self.call():
-                    if await self.preamble(self.call_attempt, self.at_timeout):  # Introduces itself.
-                        if await self.asend(files_to_send()):  # Puts files.
-	                        if await self.arecv():  # Gets files.
-								self.disconnect.set()  # Restores user interaction.
-                                await asyncio.sleep(self.keep_alive)  # Awaits user interaction.
-                                break
-                    #await self.hangup()
-                if ca < self.call_attempt:
-                    await asyncio.sleep(self.at_delay)
-            self.uart.deinit()
-            self.off()  # Restarts device.
-            await asyncio.sleep(2)
-            self.on()
-            #self.disconnect.set()  # Restores user interaction.
-            self.trigger.set(True)
-
-
-    # Sends an sms.
-    async def sms(self, text, num):
-        async with self.semaphore:
-            self.disconnect.clear()
-            self.trigger.set(False)
-            self.init_uart()
-            self.reply_timeout = self.at_timeout
-            log(self.__qualname__,'sending sms...')
-            for at in self.sms_ats1:
-                if not await self.cmd(at):
-                    log(self.__qualname__,'sms failed', at)
-                    #self.disconnect.set()
-                    self.trigger.set(True)
-                    return False
-                await asyncio.sleep(self.at_delay)
-            await self.swriter.awrite(self.sms_ats2 + num + '\r')
-            try:
-                self.data = await asyncio.wait_for(self.sreader.readline(), self.reply_timeout)
-            except asyncio.TimeoutError:
-                log(self.__qualname__,'sms failed', num)
-                #self.disconnect.set()
-                self.trigger.set(True)
-                return False
-            if self.data.startswith(self.sms_ats2 + num + '\r'):
-                verbose(self.data)
-                try:
-                    self.data = await asyncio.wait_for(self.sreader.read(2), self.reply_timeout)
-                except asyncio.TimeoutError:
-                    log(self.__qualname__,'sms failed')
-                    #self.disconnect.set()
-                    self.trigger.set(True)
-                    return False
-                if self.data.startswith(b'>'):
-                    verbose(self.data)
-                    await self.swriter.awrite(text+'\r\n')
-                    try:
-                        self.data = await asyncio.wait_for(self.sreader.readline(), 60)
-                    except asyncio.TimeoutError:
-                        log(self.__qualname__,'sms failed')
-                        #self.disconnect.set()
-                        self.trigger.set(True)
-                        return False
-                    if self.data.startswith(text):
-                        verbose(self.data)
-                        if await self.cmd('\x1a'):
-                            #self.disconnect.set()
-                            self.trigger.set(True)
-                            return True
-            log(self.__qualname__,'sms failed')
-            #self.disconnect.set()
-            self.trigger.set(True)
-            return False
-
-
-    async def main(self, task='datacall'):
-            if task == 'datacall':
-                await self.datacall()
+# dev_modem.py
+# MIT license; Copyright (c) 2020 Andrea Corbo
+#"Init_Ats":["ATE1\r","ATI\r","AT+CREG=0\r","AT+CSQ\r","AT+CBST=7,0,1\r","AT+COPS=1,2,22201\r","ATS0=1\r","AT&W\r"],
+import uasyncio as asyncio
+from primitives.semaphore import Semaphore
+import time
+from tools.utils import log, log_data, log_record, unix_epoch, verbose, disconnect, trigger
+from configs import dfl, cfg
+from device import DEVICE
+from tools.ymodemw import YMODEMW, SYN
+import tools.stats as stats
+import tools.record as record
+from tools.planner import plan
+
+class MODEM(DEVICE, YMODEMW):
+
+    def __init__(self):
+        DEVICE.__init__(self)
+        self.sreader = asyncio.StreamReader(self.uart)
+        self.swriter = asyncio.StreamWriter(self.uart, {}, dfl.WRITE_BUF_LEN)
+        self.data = b''
+        self.chars = bytearray(2)  # Control chars read by agetc.
+        self.semaphore = Semaphore()  # Data/Sms semaphore.
+        self.disconnect = disconnect
+        self.at_timeout = self.config['Modem']['At_Timeout']
+        self.init_ats = self.config['Modem']['Init_Ats']
+        self.init_timeout = self.config['Modem']['Init_Timeout']
+        self.call_ats = self.config['Modem']['Call_Ats']
+        self.hangup_ats = self.config['Modem']['Hangup_Ats']
+        self.at_delay = self.config['Modem']['At_Delay']
+        self.call_attempt = self.config['Modem']['Call_Attempt']
+        self.call_delay = self.config['Modem']['Call_Delay']
+        self.call_timeout = self.config['Modem']['Call_Timeout']
+        self.ymodem_delay = self.config['Modem']['Ymodem_Delay']
+        self.ymodem_compress = self.config['Modem']['Ymodem_Compress']
+        self.ymodem_window = self.config['Modem']['Ymodem_Window']
+        self.ymodem_adaptive = self.config['Modem']['Ymodem_Adaptive']
+        self.ymodem_fec = self.config['Modem']['Ymodem_Fec']
+        self.ymodem_bundle = self.config['Modem']['Ymodem_Bundle']
+        self.send_policy = self.config['Modem']['Send_Policy']
+        self.send_max_bytes = self.config['Modem']['Send_Max_Bytes']
+        self.send_max_time = self.config['Modem']['Send_Max_Time']
+        self.send_file_cap = self.config['Modem']['Send_File_Cap']
+        self.keep_alive = self.config['Modem']['Keep_Alive']
+        self.sms_ats1 = self.config['Modem']['Sms_Ats1']
+        self.sms_ats2 = self.config['Modem']['Sms_Ats2']
+        self.sms_timeout = self.config['Modem']['Sms_Timeout']
+        self.trigger = trigger
+        YMODEMW.__init__(self, self.agetc, self.aputc, adaptive=self.ymodem_adaptive)  # Compression and bundling negotiated.
+
+    async def startup(self, **kwargs):
+        self.on()
+        self.init_uart()
+        if await self.is_ready():
+            await self.init()
+        self.disconnect.set()
+
+    def decode(self):
+        try:
+            return self.data.decode('utf-8')
+        except UnicodeError:
+            log(self.__qualname__, 'communication error')
+            return False
+
+    # Captures commands replies.
+    async def reply(self):
+        self.data = b''
+        try:
+            self.data = await self.sreader.readline(self.reply_timeout)
+            if self.decode():
+                return True
+        except asyncio.TimeoutError:
+            log(self.__qualname__, 'no answer')
+        return False
+
+    # Sends ats commands.
+    async def cmd(self, cmd):
+        await self.swriter.awrite(cmd)
+        while await self.reply():
+            verbose(self.data)
+            if (self.data.startswith(b'OK')
+                or self.data.startswith(b'ERROR')
+                or self.data.startswith(b'NO CARRIER')
+                or self.data.startswith(b'NO ANSWER')
+                or self.data.startswith(b'CONNECT')
+                ):
+                return True
+            await asyncio.sleep_ms(10)
+        return False
+
+    # Waits for modem getting ready.
+    async def is_ready(self):
+        self.reply_timeout = self.at_timeout
+        t0 = time.time()
+        while time.time() - t0 < self.init_timeout:
+            if await self.cmd('AT\r'):
+                if self.data.startswith(b'OK'):
+                    return True
+            await asyncio.sleep_ms(100)
+        log(self.__qualname__, 'not ready')
+        return False
+
+    # Sends initialisation cmds.
+    async def init(self):
+        self.reply_timeout = self.at_timeout
+        for at in self.init_ats:
+            while True:
+                if await self.cmd(at):
+                    if self.data.startswith(b'OK'):
+                        break
+                    elif self.data.startswith(b'ERROR'):
+                        await asyncio.sleep(self.at_delay)
+                        continue
+                log(self.__qualname__, 'initialisation failed')
+                return
+            await asyncio.sleep(self.at_delay)
+        log(self.__qualname__, 'successfully initialised')
+
+    async def agetc(self, size, timeout=1):
+        buf = memoryview(self.chars)[:size] if size <= len(self.chars) else bytearray(size)
+        try:
+            await self.sreader.readexactly_into(buf, timeout)
+        except asyncio.TimeoutError:
+            return False
+        return bytes(buf)
+
+    # Receives into the passed buffer.
+    async def agetinto(self, buf, timeout=1):
+        try:
+            return await self.readinto(buf, timeout)
+        except asyncio.TimeoutError:
+            return 0
+
+    async def readinto(self, buf, timeout=None):
+        return await self.sreader.readexactly_into(buf, timeout)
+
+    # Sends n-bytes, a tuple of buffers in a single write. Times out as
+    # agetc, without a wait_for task.
+    async def aputc(self, data, timeout=1):
+        try:
+            if isinstance(data, tuple):
+                await self.swriter.awritev(data, timeout)
+                return sum(len(d) for d in data)
+            await self.swriter.awrite(data, timeout=timeout)
+        except asyncio.TimeoutError:
+            return 0
+        return len(data)
+
+    # Make a call.
+    async def call(self):
+        self.reply_timeout = self.call_timeout  # Takes in account the real call timeout.
+        log(self.__qualname__, 'calling...')
+        for at in self.call_ats:
+            if await self.cmd(at):
+                if self.data.startswith(b'CONNECT'):
+                    #await self.sreader.read(1)  # Clears last byte.
+                    return True
+            await asyncio.sleep(self.at_delay)
+        log(self.__qualname__, 'call failed')
+        return False
+
+    # hangs a call.
+    async def hangup(self):
+        self.reply_timeout = self.at_timeout
+        log(self.__qualname__, 'hangup...')
+        for at in self.hangup_ats:
+            if await self.cmd(at):
+                if self.data.startswith(b'OK'):
+                    await asyncio.sleep(self.at_delay)
+                    continue
+            log(self.__qualname__, 'hangup failed')
+            return False
+        return True
+
+    # Tells to remote who it is.
+    async def preamble(self, retry=10, timeout=10):
+        #await asyncio.sleep(2)  # Safely waits for remote getting ready.
+        ec = 0  # Error counter.
+        while ec < retry:
+            if await self.aputc(cfg.HOSTNAME.lower()):
+                verbose(cfg.HOSTNAME.lower() +' -->')
+                try:
+                    res = await self.sreader.readexactly(1, timeout)
+                    if res == b'\x06':  # ACK
+                        verbose('<-- ACK')
+                        self.plain()
+                        return True
+                    elif res == SYN:  # Remote supports windowed transfers.
+                        return await self.negotiate(self.ymodem_window, self.ymodem_fec, timeout, self.ymodem_compress, self.ymodem_bundle)
+                    else:
+                        ec += 1
+                except asyncio.TimeoutError:
+                    ec += 1
+            await asyncio.sleep(1)
+        return False
+
+    # Sends and receives data.
+    async def datacall(self):
+        self.trigger.set(False)
+        async with self.semaphore:
+            #self.disconnect.clear()  # Locks user interaction.
+            self.init_uart()
+            self.stats = stats.STATS()
+            ca = 0  # Attempts counter.
+            for _ in range(self.call_attempt):
+                ca += 1
+                self.stats.calls = ca
+                t = time.ticks_ms()
+                called = await self.call()
+                self.stats.call_ms += stats.elapsed(t)
+                if called:
+                    if await self.preamble(self.call_attempt, self.at_timeout):  # Introduces itself.
+                        t = time.ticks_ms()
+                        files, caps = plan(self.send_policy, self.budget(), self.send_file_cap)
+                        sent = await self.asend(files, caps)  # Puts files.
+                        self.stats.send_ms += stats.elapsed(t)
+                        if sent:
+                            t = time.ticks_ms()
+                            rcvd = await self.arecv()  # Gets files.
+                            self.stats.recv_ms += stats.elapsed(t)
+                            if rcvd:
+                                self.stats.result = 1
+                                self.disconnect.set()  # Restores user interaction.
+                                await asyncio.sleep(self.keep_alive)  # Awaits user interaction.
+                                break
+                    #await self.hangup()
+                if ca < self.call_attempt:
+                    await asyncio.sleep(self.at_delay)
+            stats.last = self.stats
+            await self.log_stats()
+            self.uart.deinit()
+            self.off()  # Restarts device.
+            await asyncio.sleep(2)
+            self.on()
+            #self.disconnect.set()  # Restores user interaction.
+            self.trigger.set(True)
+
+
+    # Bytes a call can send, the time budget is turned in bytes at the
+    # throughput of the last call, or at half the baudrate, 0 if unlimited.
+    def budget(self):
+        b = self.send_max_bytes
+        if self.send_max_time:
+            rate = stats.last.throughput() if stats.last else 0
+            if not rate:
+                rate = int(self.config['Uart']['Baudrate']) / 20
+            t = int(self.send_max_time * rate)
+            b = min(b, t) if b else t
+        return b
+
+    # Logs the telemetry of the last data call.
+    async def log_stats(self):
+        epoch = unix_epoch(self.stats.epoch)
+        if self.data_format == 'bin':
+            await log_record(self.__qualname__, epoch, self.stats.fields(), self.stats.tail())
+            return
+        await log_data(record.csv(self.__qualname__, epoch, self.stats.fields(), self.stats.tail(), dfl.DATA_SEPARATOR))
+
+    # Sends an sms.
+    async def sms(self, text, num):
+        async with self.semaphore:
+            self.disconnect.clear()
+            self.trigger.set(False)
+            self.init_uart()
+            self.reply_timeout = self.at_timeout
+            log(self.__qualname__,'sending sms...')
+            for at in self.sms_ats1:
+                if not await self.cmd(at):
+                    log(self.__qualname__,'sms failed', at)
+                    #self.disconnect.set()
+                    self.trigger.set(True)
+                    return False
+                await asyncio.sleep(self.at_delay)
+            await self.swriter.awrite(self.sms_ats2 + num + '\r')
+            try:
+                self.data = await self.sreader.readline(self.reply_timeout)
+            except asyncio.TimeoutError:
+                log(self.__qualname__,'sms failed', num)
+                #self.disconnect.set()
+                self.trigger.set(True)
+                return False
+            if self.data.startswith(self.sms_ats2 + num + '\r'):
+                verbose(self.data)
+                try:
+                    self.data = await self.sreader.read(2, self.reply_timeout)
+                except asyncio.TimeoutError:
+                    log(self.__qualname__,'sms failed')
+                    #self.disconnect.set()
+                    self.trigger.set(True)
+                    return False
+                if self.data.startswith(b'>'):
+                    verbose(self.data)
+                    await self.swriter.awrite(text+'\r\n')
+                    try:
+                        self.data = await self.sreader.readline(60)
+                    except asyncio.TimeoutError:
+                        log(self.__qualname__,'sms failed')
+                        #self.disconnect.set()
+                        self.trigger.set(True)
+                        return False
+                    if self.data.startswith(text):
+                        verbose(self.data)
+                        if await self.cmd('\x1a'):
+                            #self.disconnect.set()
+                            self.trigger.set(True)
+                            return True
+            log(self.__qualname__,'sms failed')
+            #self.disconnect.set()
+            self.trigger.set(True)
+            return False
+
+
+    async def main(self, task='datacall'):
+            if task == 'datacall':
+                await self.datacall()
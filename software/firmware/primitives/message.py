@@ -3,10 +3,13 @@
 # Copyright (c) 2018-2020 Peter Hinch
 # Released under the MIT License (MIT) - see LICENSE file
 
-try:
-    import uasyncio as asyncio
-except ImportError:
-    import asyncio
+from uasyncio import core
+import io
+
+MP_STREAM_POLL_RD = const(1)
+MP_STREAM_POLL = const(3)
+MP_STREAM_ERROR = const(-1)
+
 # Usage:
 # from primitives.message import Message
 
@@ -40,22 +43,38 @@ except ImportError:
         #return self._data
 
 # Has an ISR-friendly .set()
-class Message():
+# Waiting tasks are parked instead of polling. The first waiter is queued on
+# the scheduler poller, which wakes it up as soon as the flag is found set,
+# the others wait in a queue and are woken up by it. set() only stores the flag
+# and the payload, it is safe from other threads and ISRs.
+class Message(io.IOBase):
     def __init__(self, delay_ms=0):
-        self.delay_ms = delay_ms
+        self.delay_ms = delay_ms  # Unused, kept for compatibility.
+        self._waiting = core.TaskQueue()  # Tasks waiting behind the polled one.
+        self._polled = False  # A task is queued on the poller.
         self.clear()
 
     def clear(self):
         self._flag = False
         self._data = None
 
-    async def wait(self):  # CPython comptaibility
+    async def wait(self):
         while not self._flag:
-            await asyncio.sleep_ms(self.delay_ms)
+            if self._polled:
+                self._waiting.push_head(core.cur_task)
+                core.cur_task.data = self._waiting  # Lets cancel remove the task.
+                yield
+            else:
+                self._polled = True
+                try:
+                    yield core._io_queue.queue_read(self)
+                finally:  # Set or cancelled, next waiter takes over if needed.
+                    self._polled = False
+                    while self._waiting.peek():
+                        core._task_queue.push_head(self._waiting.pop_head())
 
     def __await__(self):
-        while not self._flag:
-            await asyncio.sleep_ms(self.delay_ms)
+        await self.wait()
 
     __iter__ = __await__
 
@@ -68,3 +87,15 @@ class Message():
 
     def value(self):
         return self._data
+
+    def read(self, _):
+        pass
+
+    # Polled by the scheduler.
+    def ioctl(self, req, arg):
+        ret = MP_STREAM_ERROR
+        if req == MP_STREAM_POLL:
+            ret = 0
+            if arg & MP_STREAM_POLL_RD and self._flag:
+                ret |= MP_STREAM_POLL_RD
+        return ret
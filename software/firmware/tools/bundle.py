@@ -0,0 +1,96 @@
+# tools/bundle.py
+# MIT license; Copyright (c) 2021 Andrea Corbo
+
+# Read only stream bundling the unsent part of several files, sent by ymodem as
+# a single file flagged with BFLAG in its file name packet.
+# The bundle starts with a text manifest, one line per member
+#   name offset length mtime\n
+# ended by an empty line, followed by the member data in manifest order.
+# Offset is the position in the member file of its first sent byte, so the
+# remote appends each member where it left it and a partially received bundle
+# is still good up to its last byte.
+# The acknowledged bundle pointer is saved back as the pointer of each member,
+# files are resumed one by one on the next transmission.
+
+from tools.inventory import inventory
+
+BFLAG = 'b'  # File name packet flag of bundles.
+SFX = '.bdl'  # Bundle name suffix.
+
+class BUNDLE:
+
+    # Members are [file, tmpf, ptr, end, mtime] lists.
+    def __init__(self, name, members):
+        self.name = name
+        self.members = members
+        man = ''
+        for m in members:
+            man += '{} {} {} {}\n'.format(m[0].split('/')[-1], m[2], m[3] - m[2], m[4])
+        self.man = (man + '\n').encode()
+        self.offs = []  # Bundle offset of each member.
+        off = len(self.man)
+        for m in members:
+            self.offs.append(off)
+            off += m[3] - m[2]
+        self.size = off
+        self.mtime = max(m[4] for m in members)
+        self.pos = 0
+        self.cur = None  # Open member.
+        self.f = None
+        self.saved = [m[2] for m in members]  # Last saved member pointers.
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.f:
+            self.f.close()
+            self.f = None
+            self.cur = None
+
+    def seek(self, pos):
+        self.pos = pos
+
+    def read(self, n):
+        b = bytearray(min(n, max(self.size - self.pos, 0)))
+        return b[:self.readinto(b)]
+
+    # Fills the passed buffer across member boundaries, returns the read bytes.
+    def readinto(self, buf):
+        mv = memoryview(buf)
+        n = 0
+        while n < len(mv) and self.pos < self.size:
+            if self.pos < len(self.man):
+                r = min(len(mv) - n, len(self.man) - self.pos)
+                mv[n:n + r] = self.man[self.pos:self.pos + r]
+            else:
+                i = len(self.offs) - 1
+                while self.offs[i] > self.pos:
+                    i -= 1
+                m = self.members[i]
+                if self.cur != i:
+                    self.close()
+                    self.f = open(m[0], 'rb')
+                    self.cur = i
+                left = self.offs[i] + m[3] - m[2] - self.pos
+                self.f.seek(m[2] + self.pos - self.offs[i])
+                r = self.f.readinto(mv[n:n + min(len(mv) - n, left)])
+                if not r:
+                    break  # Member shrank.
+            n += r
+            self.pos += r
+        return n
+
+    # Saves the pointer of each member advanced up to the passed bundle
+    # pointer.
+    def save(self, ptr):
+        for i, m in enumerate(self.members):
+            p = m[2] + min(max(ptr - self.offs[i], 0), m[3] - m[2])
+            if p != self.saved[i]:
+                with open(m[1], 'w') as t:
+                    t.write('{}\n'.format(p))
+                inventory.sent(m[1], p)
+                self.saved[i] = p
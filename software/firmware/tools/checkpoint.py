@@ -0,0 +1,89 @@
+# tools/checkpoint.py
+# MIT license; Copyright (c) 2021 Andrea Corbo
+
+# Resume pointer of a file being sent by ymodem, saved in batches.
+# Acked pointers are appended as lines to the temp file, kept open for the
+# whole transfer, at most every PACKETS acked packets or MS milliseconds and on
+# reply timeouts. When the transfer ends, whatever the outcome, the temp file
+# is compacted to the last acked pointer. The pointer is the last complete
+# line, a torn append on a crash only loses the last checkpoint, a resumed
+# transfer resends at most a batch of packets. A reopened log starts with a
+# new line, torn digits never join the next pointer.
+# Bundles save the pointer of each member instead.
+
+import time
+from tools.utils import verbose
+from tools.stats import elapsed
+from tools.bundle import BUNDLE
+from tools.inventory import inventory, last
+from tools.executor import executor
+
+PACKETS = 8  # Acked packets between checkpoints.
+MS = 5000  # Max time between checkpoints [ms].
+
+class CHECKPOINT:
+
+    def __init__(self, tmpf, ptr):
+        self.tmpf = tmpf  # Temp file or bundle.
+        self.ptr = ptr  # Last acked pointer.
+        self.saved = ptr  # Last saved pointer.
+        self.n = 0  # Packets acked since the last checkpoint.
+        self.t = time.ticks_ms()  # Last checkpoint.
+        self.log = None  # Open pointer log.
+        self.job = None  # Pointer being saved.
+
+    # Records the acked pointer after n more packets, saves it when due.
+    async def ack(self, ptr, n=1):
+        self.ptr = ptr
+        self.n += n
+        if self.n >= PACKETS or elapsed(self.t) >= MS:
+            await self.save()
+
+    # Saves the last acked pointer if not yet.
+    async def save(self):
+        self.n = 0
+        self.t = time.ticks_ms()
+        if self.ptr == self.saved:
+            return
+        if self.job is not None:
+            await self.job  # Waits for the previous pointer to be saved.
+        self.saved = self.ptr
+        self.job = await executor.submit(self._append, self.ptr)
+
+    # Compacts the pointer log to the last acked pointer.
+    async def close(self):
+        if self.job is not None:
+            await self.job
+        if self.log is None and self.ptr == self.saved:
+            return  # Nothing sent.
+        self.saved = self.ptr
+        self.job = await executor.submit(self._compact, self.ptr)
+        await self.job
+
+    def _append(self, ptr):
+        try:
+            if isinstance(self.tmpf, BUNDLE):
+                self.tmpf.save(ptr)
+            else:
+                if self.log is None:
+                    self.log = open(self.tmpf, 'a')
+                    self.log.write('\n')
+                self.log.write('{}\n'.format(ptr))
+                self.log.flush()
+                inventory.sent(self.tmpf, ptr)
+        except:
+            verbose('UNABLE TO SAVE POINTER {}'.format(ptr))
+
+    def _compact(self, ptr):
+        try:
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+            if isinstance(self.tmpf, BUNDLE):
+                self.tmpf.save(ptr)
+            else:
+                with open(self.tmpf, 'w') as t:
+                    t.write('{}\n'.format(ptr))
+                inventory.sent(self.tmpf, ptr)
+        except:
+            verbose('UNABLE TO SAVE POINTER {}'.format(ptr))
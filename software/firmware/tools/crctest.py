@@ -0,0 +1,57 @@
+# tools/crctest.py
+# MIT license; Copyright (c) 2021 Andrea Corbo
+#
+# Checks and benchmarks the ymodem crc engine against the table driven python
+# crc it replaced, on 128 and 1024 bytes blocks.
+# Run on the board with import tools.crctest
+
+import time
+from tools.crc import crc16, cksum, CRC_TAB
+
+try:
+    ticks_us = time.ticks_us
+    ticks_diff = time.ticks_diff
+except AttributeError:  # Host.
+    ticks_us = lambda: int(time.perf_counter() * 1000000)
+    ticks_diff = lambda a, b: a - b
+
+def ref_crc(data, crc=0):
+    for c in bytearray(data):
+        crctbl_idx = ((crc >> 8) ^ c) & 0xff
+        crc = ((crc << 8) ^ CRC_TAB[crctbl_idx]) & 0xffff
+    return crc & 0xffff
+
+def bench(f, data, n):
+    t = ticks_us()
+    for _ in range(n):
+        f(data)
+    t = ticks_diff(ticks_us(), t)
+    return t / n, len(data) * n * 1000000 // max(t, 1)
+
+fail = 0
+def result(ok, msg):
+    global fail
+    if not ok:
+        print('FAIL', msg)
+        fail += 1
+        return
+    print('PASS', msg)
+
+block = bytearray([(i * 7 + 3) & 0xff for i in range(1024)])
+mv = memoryview(block)
+result(crc16(b'123456789') == 0x31c3, 'crc-16/xmodem check value')
+result(crc16(block) == ref_crc(block), 'crc16 matches table driven crc')
+result(crc16(mv[300:], crc16(mv[:300])) == crc16(block), 'incremental crc over memoryviews')
+result(cksum(block) == sum(block) % 256, 'checksum')
+result(cksum(mv[100:], cksum(mv[:100])) == cksum(block), 'incremental checksum')
+for sz in (128, 1024):
+    data = mv[:sz]
+    n = 2048 // sz * 10
+    us, bps = bench(ref_crc, data, n)
+    print('{:5d} bytes python {:9.1f}us {:9d}B/s'.format(sz, us, bps))
+    us, bps = bench(crc16, data, n)
+    print('{:5d} bytes crc16  {:9.1f}us {:9d}B/s'.format(sz, us, bps))
+if fail:
+    print(fail, 'FAILURES OCCURRED')
+else:
+    print('ALL TESTS PASSED')
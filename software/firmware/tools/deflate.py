@@ -0,0 +1,118 @@
+# tools/deflate.py
+# MIT license; Copyright (c) 2021 Andrea Corbo
+
+# Raw deflate (rfc1951) encoder using the fixed huffman codes.
+# Each call packs a single final block no longer than the passed budget, so
+# every ymodem packet can be inflated on its own by zlib.decompress(data, -15).
+# Data not gaining from the fixed codes, as binary or already compressed one,
+# is packed in a stored block instead, never costing more than 5 bytes.
+
+MIN_MATCH = 3
+MAX_MATCH = 258
+WINDOW = 4096  # Max match distance [bytes].
+
+LBASE = (3, 4, 5, 6, 7, 8, 9, 10, 11, 13, 15, 17, 19, 23, 27, 31, 35, 43, 51,
+    59, 67, 83, 99, 115, 131, 163, 195, 227, 258)  # Length codes 257..285.
+LEXT = (0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4,
+    4, 5, 5, 5, 5, 0)
+DBASE = (1, 2, 3, 4, 5, 7, 9, 13, 17, 25, 33, 49, 65, 97, 129, 193, 257, 385,
+    513, 769, 1025, 1537, 2049, 3073, 4097, 6145, 8193, 12289, 16385, 24577)  # Distance codes 0..29.
+DEXT = (0, 0, 0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 6, 6, 7, 7, 8, 8, 9, 9, 10,
+    10, 11, 11, 12, 12, 13, 13)
+
+def _rev(code, n):
+    r = 0
+    for _ in range(n):
+        r = (r << 1) | (code & 1)
+        code >>= 1
+    return r
+
+# Fixed literal / length codes, bit reversed as huffman codes are sent msb first.
+LIT = []
+for sym in range(288):
+    if sym < 144:
+        LIT.append((_rev(0x30 + sym, 8), 8))
+    elif sym < 256:
+        LIT.append((_rev(0x190 + sym - 144, 9), 9))
+    elif sym < 280:
+        LIT.append((_rev(sym - 256, 7), 7))
+    else:
+        LIT.append((_rev(0xc0 + sym - 280, 8), 8))
+DIST = [_rev(i, 5) for i in range(30)]
+
+# Match length to length code index.
+LCODE = bytearray(MAX_MATCH + 1)
+for i in range(len(LBASE)):
+    for l in range(LBASE[i], min(LBASE[i] + (1 << LEXT[i]), MAX_MATCH + 1)):
+        LCODE[l] = i
+
+def _dcode(dist):
+    i = 0
+    while i < 29 and DBASE[i + 1] <= dist:
+        i += 1
+    return i
+
+# Compresses src[start:end] in at most budget bytes.
+# Returns the deflate block and the count of consumed source bytes.
+def compress(src, start=0, end=None, budget=1024):
+    if end is None:
+        end = len(src)
+    out = bytearray()
+    acc = 3  # Bfinal, fixed huffman block type.
+    n = 3  # Bits in acc.
+    bits = 3  # Total bits.
+    limit = budget * 8 - 7  # Keeps room for the end of block code.
+    hashes = {}
+    i = start
+    while i < end:
+        m = 0
+        if i + MIN_MATCH <= end:
+            key = (src[i] << 16) | (src[i + 1] << 8) | src[i + 2]
+            j = hashes.get(key)
+            hashes[key] = i
+            if j is not None and i - j <= WINDOW:
+                top = min(MAX_MATCH, end - i)
+                while m < top and src[j + m] == src[i + m]:
+                    m += 1
+        if m >= MIN_MATCH:
+            l = LCODE[m]
+            d = _dcode(i - j)
+            code, nb = LIT[257 + l]
+            nb2 = nb + LEXT[l] + 5 + DEXT[d]
+            if bits + nb2 > limit:
+                break
+            acc |= (code | ((m - LBASE[l]) << nb)) << n
+            n += nb + LEXT[l]
+            acc |= (DIST[d] | ((i - j - DBASE[d]) << 5)) << n
+            n += 5 + DEXT[d]
+            bits += nb2
+            i += m
+        else:
+            code, nb = LIT[src[i]]
+            if bits + nb > limit:
+                break
+            acc |= code << n
+            n += nb
+            bits += nb
+            i += 1
+        while n >= 8:
+            out.append(acc & 0xff)
+            acc >>= 8
+            n -= 8
+    n += 7  # End of block, code 0.
+    while n > 0:
+        out.append(acc & 0xff)
+        acc >>= 8
+        n -= 8
+    k = min(end - start, budget - 5)
+    if i - start < k or len(out) > k + 5:
+        return _stored(src, start, k), k
+    return out, i - start
+
+# Packs src[start:start + k] as is in a final stored block.
+def _stored(src, start, k):
+    out = bytearray(k + 5)
+    out[0] = 1  # Bfinal, stored block type.
+    out[1:5] = bytes((k & 0xff, k >> 8, ~k & 0xff, ~k >> 8 & 0xff))
+    out[5:] = src[start:start + k]
+    return out
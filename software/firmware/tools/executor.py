@@ -0,0 +1,102 @@
+# tools/executor.py
+# MIT license; Copyright (c) 2021 Andrea Corbo
+
+# Long lived worker threads running the blocking jobs of the tasks, file io
+# above all, instead of a new thread per job.
+# Jobs are queued in a ring of fixed size, submitting waits for a free slot.
+# Each job gets a FUTURE, awaiting it waits for the job, awaiting its result()
+# gives the result of the job or raises its exception.
+# Futures are messages set by the workers, waiters are woken up by the
+# scheduler poller, no sleep between a job done and its waiter running.
+# Workers sleep on a lock while the queue is empty and are started on the
+# first job.
+
+import _thread
+from primitives.message import Message
+from configs import dfl
+
+# Awaitable result of a job.
+class FUTURE(Message):
+
+    def __init__(self):
+        super().__init__()
+        self.err = None  # Exception raised by the job.
+
+    # Waits for the job, returns its result or raises its exception.
+    async def result(self):
+        await self.wait()
+        if self.err:
+            raise self.err
+        return self._data
+
+class EXECUTOR:
+
+    def __init__(self, workers=dfl.EXECUTOR_WORKERS, size=dfl.EXECUTOR_JOBS):
+        self.workers = workers
+        self.jobs = [None] * size  # Ring of (func, args, future).
+        self.head = 0  # First queued job.
+        self.cnt = 0  # Queued jobs.
+        self.lock = _thread.allocate_lock()  # Guards the ring.
+        self.wake = _thread.allocate_lock()  # Released to wake up a worker.
+        self.wake.acquire()
+        self.space = Message()  # Set when a slot gets free.
+        self.started = 0  # Running workers.
+
+    # Queues a job, returns its future or None if the queue is full. Safe
+    # from any thread.
+    def post(self, func, *args):
+        fut = FUTURE()
+        with self.lock:
+            if self.cnt == len(self.jobs):
+                return None
+            self.jobs[(self.head + self.cnt) % len(self.jobs)] = (func, args, fut)
+            self.cnt += 1
+        while self.started < self.workers:
+            self.started += 1
+            _thread.start_new_thread(self._work, ())
+        if self.wake.locked():
+            try:
+                self.wake.release()
+            except RuntimeError:
+                pass  # Released meanwhile.
+        return fut
+
+    # Queues a job waiting for a free slot, returns its future.
+    async def submit(self, func, *args):
+        while True:
+            self.space.clear()
+            fut = self.post(func, *args)
+            if fut is not None:
+                return fut
+            await self.space
+
+    # Runs a job, returns its result.
+    async def run(self, func, *args):
+        return await (await self.submit(func, *args)).result()
+
+    def _pop(self):
+        with self.lock:
+            if not self.cnt:
+                return None
+            job = self.jobs[self.head]
+            self.jobs[self.head] = None
+            self.head = (self.head + 1) % len(self.jobs)
+            self.cnt -= 1
+        self.space.set()
+        return job
+
+    def _work(self):
+        while True:
+            job = self._pop()
+            if job is None:
+                self.wake.acquire()  # Sleeps until a job gets queued.
+                continue
+            func, args, fut = job
+            try:
+                res = func(*args)
+            except Exception as err:
+                fut.err = err
+                res = None
+            fut.set(res)
+
+executor = EXECUTOR()  # Shared by all tasks.
@@ -0,0 +1,174 @@
+# tools/inventory.py
+# MIT license; Copyright (c) 2021 Andrea Corbo
+
+# Catalog of the daily data files, kept in ram so that listings cost no
+# directory scan. Entries are by day file name, YYYYMMDD or YYYYMMDD.bin:
+#   [size, sent, archived]
+# size is on file, sent the saved resume pointer, archived once renamed with
+# SENT_FILE_PFX. The data sinks, the ymodem pointers and the archiving keep it
+# up to date as they go.
+# The data directory is scanned once, on the first use after a boot without a
+# persisted catalog. If persisted, changes of state are saved by the flusher
+# and the unsent files are checked against the directory when loading, the
+# ones of the last BUF_DAYS days too, so records written after the last save
+# are never lost.
+# Files archived before the last BUF_DAYS days are dropped on save, so the
+# catalog does not grow with every day ever logged. It is written out by an
+# executor worker, not on the event loop.
+
+import os
+import json
+import time
+from tools.executor import executor
+from configs import dfl, cfg
+
+class INVENTORY:
+
+    def __init__(self, dir, file=None):
+        self.dir = dir
+        self.file = file  # Persisted catalog, None keeps it in ram only.
+        self.files = None  # Entries by name, loaded on first use.
+        self.dirty = False  # Changes not yet persisted.
+        self.job = None  # Catalog being written out.
+
+    # Gets the catalog, loading it if not yet.
+    def _files(self):
+        if self.files is None:
+            self.files = {}
+            if not self._load():
+                self._scan()
+            self.dirty = True
+        return self.files
+
+    # Scans the data directory.
+    def _scan(self):
+        for f in os.listdir(self.dir):
+            archived = f.startswith(dfl.SENT_FILE_PFX)
+            if archived:
+                f = f[len(dfl.SENT_FILE_PFX):]
+            if is_day(f):
+                self._stat(f, archived)
+
+    # Loads the persisted catalog, checking the entries that may have changed.
+    def _load(self):
+        if not self.file:
+            return False
+        try:
+            with open(self.file) as c:
+                self.files = json.load(c)
+        except:
+            self.files = {}
+            return False
+        days = [day(time.time() - i * 86400) for i in range(cfg.BUF_DAYS + 1)]
+        for f in list(self.files) + days + [d + dfl.BIN_FILE_SFX for d in days]:
+            e = self.files.get(f)
+            if not e or not e[2]:
+                self._stat(f, False)
+        return True
+
+    # Updates the entry of the passed file from the directory, forgets it if
+    # missing.
+    def _stat(self, f, archived):
+        try:
+            size = os.stat(self.dir + '/' + (dfl.SENT_FILE_PFX if archived else '') + f)[6]
+        except OSError:
+            if f in self.files and not self.files[f][2]:
+                try:
+                    os.stat(self.dir + '/' + dfl.SENT_FILE_PFX + f)
+                    self._stat(f, True)  # Archived meanwhile.
+                    return
+                except OSError:
+                    pass
+            self.files.pop(f, None)
+            return
+        sent = size if archived else last(self.dir + '/' + dfl.TMP_FILE_PFX + f)
+        self.files[f] = [size, sent, archived]
+
+    # Writes out the catalog if changed, called periodically. Drops the
+    # files archived before the last BUF_DAYS days.
+    def save(self):
+        if not self.file or not self.dirty or self.files is None:
+            return
+        if self.job is not None and not self.job.is_set():
+            return  # Previous save still running.
+        oldest = day(time.time() - cfg.BUF_DAYS * 86400)
+        for f in [f for f, e in self.files.items() if e[2] and f[:8] < oldest]:
+            del self.files[f]
+        files = {f: list(e) for f, e in self.files.items()}  # Snapshot for the worker.
+        job = executor.post(self._write, files)
+        if job is not None:
+            self.dirty = False
+            self.job = job
+
+    def _write(self, files):
+        try:
+            with open(self.file, 'w') as c:
+                json.dump(files, c)
+        except:
+            self.dirty = True  # Retried on the next save.
+
+    # Gets the [size, sent, archived] entry of the passed file, None if unknown.
+    def get(self, f):
+        return self._files().get(f)
+
+    # Records n bytes appended to the passed file, new files get added.
+    def grow(self, f, n):
+        e = self._files().get(f)
+        if e:
+            e[0] += n
+        elif is_day(f):
+            self.files[f] = [n, 0, False]
+            self.dirty = True
+
+    # Records the resume pointer saved in the passed temp file.
+    def sent(self, tmpf, ptr):
+        f = tmpf.split('/')[-1][len(dfl.TMP_FILE_PFX):]
+        e = self._files().get(f)
+        if e and tmpf.startswith(self.dir) and e[1] != ptr:
+            e[1] = ptr
+            self.dirty = True
+
+    # Records the passed file archived.
+    def archive(self, f):
+        e = self._files().get(f)
+        if e:
+            e[1] = e[0]
+            e[2] = True
+            self.dirty = True
+
+    # Returns the sorted [name, size, sent, archived] entries, unsent files
+    # only if passed.
+    def entries(self, unsent=False):
+        return sorted([f] + e for f, e in self._files().items() if not (unsent and e[2]))
+
+# Gets the resume pointer saved in the passed temp file, the last complete
+# line, 0 if none.
+def last(tmpf):
+    try:
+        with open(tmpf) as t:
+            lines = t.read().split('\n')
+        if len(lines) == 1:
+            return int(lines[0])  # Written by older firmware.
+        for l in reversed(lines[:-1]):
+            if l:
+                return int(l)
+    except:
+        pass  # File not exists.
+    return 0
+
+# Day file name of the passed epoch.
+def day(epoch):
+    t = time.localtime(epoch)
+    return '{:04d}{:02d}{:02d}'.format(t[0], t[1], t[2])
+
+# True if the passed name is a daily data file.
+def is_day(f):
+    if f[8:] not in ('', dfl.BIN_FILE_SFX):
+        return False
+    try:
+        int(f[:8])  # Names of datafiles are integer YYYYMMDD.
+    except ValueError:
+        return False
+    return True
+
+inventory = INVENTORY(dfl.DATA_DIR, dfl.INVENTORY_FILE)
@@ -0,0 +1,72 @@
+# tools/planner.py
+# MIT license; Copyright (c) 2021 Andrea Corbo
+
+# Plans the files sent by a data call.
+# Data files are queued by policy, the syslog always goes last:
+#   oldest_first  days in order, as files_to_send yields them
+#   newest_first  latest days first
+#   today_first   today, then the other days in order
+# Each file gets at most cap bytes and the whole call at most budget bytes,
+# estimated from file sizes and the saved resume pointers, 0 meaning no limit.
+# Files or parts left out get sent by the next calls, resuming from their
+# pointers.
+
+import os
+from configs import dfl
+from tools.utils import files_to_send, dailyfile, verbose
+from tools.checkpoint import last
+from tools.inventory import inventory
+
+POLICIES = ('oldest_first', 'newest_first', 'today_first')
+
+# Bytes of the passed file left to send, data files by the catalog.
+def unsent(file):
+    e = inventory.get(file.split('/')[-1]) if file.startswith(dfl.DATA_DIR) else None
+    if e:
+        return max(e[0] - e[1], 0)
+    tmpf = file.replace(file.split('/')[-1], dfl.TMP_FILE_PFX + file.split('/')[-1])
+    try:
+        return max(os.stat(file)[6] - last(tmpf), 0)
+    except:
+        return 0
+
+# Queues the files to send by the passed policy.
+def queue(policy='oldest_first'):
+    if policy not in POLICIES:
+        raise ValueError('INVALID POLICY {}'.format(policy))
+    data = []
+    logs = []
+    for f in files_to_send():
+        if f == '\x00':
+            continue
+        if f.startswith(dfl.LOG_DIR):
+            logs.append(f)
+        else:
+            data.append(f)
+    if policy == 'newest_first':
+        data.reverse()
+    elif policy == 'today_first':
+        today = dailyfile()
+        data = ([f for f in data if f.split('/')[-1][:8] == today]
+            + [f for f in data if f.split('/')[-1][:8] != today])
+    return data + logs
+
+# Returns the files to send, ended by the null file, and the max bytes to
+# send of the capped ones.
+def plan(policy='oldest_first', budget=0, cap=0):
+    files = []
+    caps = {}
+    left = budget
+    for f in queue(policy):
+        n = unsent(f)
+        if n and budget and left <= 0:
+            verbose('BUDGET EXHAUSTED, {} LEFT TO THE NEXT CALL'.format(f))
+            continue  # Files already sent still get archived.
+        if cap and n > cap:
+            n = caps[f] = cap
+        if budget and n > left:
+            n = caps[f] = left
+        left -= n
+        files.append(f)
+    files.append('\x00')  # Null file is needed to end ymodem transmission.
+    return files, caps
@@ -0,0 +1,166 @@
+# tools/record.py
+# MIT license; Copyright (c) 2021 Andrea Corbo
+
+import struct
+import time
+
+SYNC = 0xa5
+HDR = '<BBIH'  # Sync, label id, unix epoch, number of fields.
+HDR_LEN = struct.calcsize(HDR)
+EPOCH = 946684800 if time.gmtime(0)[0] == 2000 else 0  # Embedded epoch offset.
+
+# Formats utc dates according to iso8601 standardization yyyy-mm-ddThh:mm:ssZ
+def iso8601(epoch):
+    return '{}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}Z'.format(*time.gmtime(epoch - EPOCH)[0:6])
+
+# Rebuilds the adcp record layout: instrument date and time, sensors, bins.
+def _adcp(fields, tail):
+    nbins = int(fields[17])
+    beams = len(tail) // nbins if nbins else 0
+    cells = []
+    for bin in range(nbins):
+        cells.append('#{}'.format(bin + 1))  # (#Cell number)
+        cells.extend(tail[bin * beams:bin * beams + beams])
+    return ['{}/{}/20{}'.format(fields[0], fields[1], fields[2]),  # dd/mm/yyyy
+        '{}:{}'.format(fields[3], fields[4])] + fields[5:] + cells  # hh:mm
+
+# Binary record schemas, one per driver.
+# name: (label id, label, fields, repeated field, layout)
+# Each field is described by (struct code, scale, csv format), integer fields
+# with a scale store round(value * scale). The repeated field fills the record
+# up to the number of fields given in the header.
+SCHEMAS = {
+    'METEO': (1, '$YOUNG', (
+        ('f', 0, '{:.2f}'),  # Vect avg wind direction.
+        ('f', 0, '{:.2f}'),  # Avg wind speed.
+        ('f', 0, '{:.2f}'),  # Avg temp.
+        ('f', 0, '{:.2f}'),  # Avg pressure.
+        ('f', 0, '{:.2f}'),  # Avg relative humidity.
+        ('f', 0, '{:.2f}'),  # Avg heading.
+        ('f', 0, '{:.2f}'),  # Vect avg wind speed.
+        ('f', 0, '{:.2f}'),  # Gust speed.
+        ('f', 0, '{:.2f}'),  # Gust direction.
+        ('H', 0, '{:0d}'),   # Number of records.
+        ('f', 0, '{:.2f}'),  # Solar radiance.
+        ), None, None),
+    'ADCP': (2, '$NORTEK', (
+        ('B', 0, '{:02x}'),  # Day (bcd).
+        ('B', 0, '{:02x}'),  # Month (bcd).
+        ('B', 0, '{:02x}'),  # Year (bcd).
+        ('B', 0, '{:02x}'),  # Hour (bcd).
+        ('B', 0, '{:02x}'),  # Minute (bcd).
+        ('h', 10, '{:.2f}'),  # Battery.
+        ('h', 10, '{:.2f}'),  # SoundSpeed.
+        ('h', 10, '{:.2f}'),  # Heading.
+        ('h', 10, '{:.2f}'),  # Pitch.
+        ('h', 10, '{:.2f}'),  # Roll.
+        ('I', 1000, '{:.2f}'),  # Pressure.
+        ('h', 100, '{:.2f}'),  # Temperature.
+        ('f', 0, '{:.2f}'),  # Flow.
+        ('B', 0, ('ENU', 'XYZ', 'BEAM')),  # CoordSystem.
+        ('H', 0, '{}'),  # BlankingDistance.
+        ('H', 0, '{}'),  # MeasInterval.
+        ('f', 0, '{:.2f}'),  # BinLength.
+        ('H', 0, '{}'),  # NBins.
+        ('B', 0, ('UP', 'DOWN')),  # TiltSensorMounting.
+        ), ('h', 1000, '{:.3f}'), _adcp),  # Bin velocities, beams by bin.
+    'SYSMON': (3, '$MSTAT', (
+        ('f', 0, '{:.4f}'),  # Battery voltage [V].
+        ('f', 0, '{:.4f}'),  # Current consumption [A].
+        ('f', 0, '{:.4f}'),  # Internal vessel temp [°C].
+        ('f', 0, '{:.4f}'),  # Core temp [°C].
+        ('f', 0, '{:.4f}'),  # Core vbat [V].
+        ('f', 0, '{:.4f}'),  # Core vref [V].
+        ('f', 0, '{:.4f}'),  # Vref [V].
+        ('I', 0, '{}'),  # SD free space [kB].
+        ), None, None),
+    'MODEM': (4, '$MODEM', (
+        ('B', 0, '{}'),  # Call attempts.
+        ('I', 0, '{}'),  # Call time [ms].
+        ('I', 0, '{}'),  # Send time [ms].
+        ('I', 0, '{}'),  # Receive time [ms].
+        ('I', 0, '{}'),  # Clear to send wait [ms].
+        ('I', 0, '{}'),  # Sent bytes.
+        ('f', 0, '{:.1f}'),  # Throughput [B/s].
+        ('I', 0, '{}'),  # Received bytes.
+        ('H', 0, '{}'),  # Data packets.
+        ('H', 0, '{}'),  # Resent packets.
+        ('H', 0, '{}'),  # Naks.
+        ('H', 0, '{}'),  # Timeouts.
+        ('H', 0, '{}'),  # Sent files.
+        ('B', 0, ('FAILED', 'OK')),  # Result.
+        ), ('I', 0, '{}'), None),  # Bytes and time [ms] of each sent file.
+    }
+
+IDS = {}  # Label id to schema name.
+for name in SCHEMAS:
+    IDS[SCHEMAS[name][0]] = name
+
+def _scale(spec, value):
+    if spec[1]:
+        return int(round(value * spec[1]))
+    return value
+
+def _fmt(fields):
+    return '<' + ''.join([spec[0] for spec in fields])
+
+# Packs a record, fields must follow the driver schema.
+def encode(name, epoch, fields, tail=()):
+    id, label, fixed, rep, layout = SCHEMAS[name]
+    ffmt = _fmt(fixed)
+    tfmt = '<{}{}'.format(len(tail), rep[0]) if tail else '<'
+    buf = bytearray(HDR_LEN + struct.calcsize(ffmt) + struct.calcsize(tfmt))
+    struct.pack_into(HDR, buf, 0, SYNC, id, epoch, len(fixed) + len(tail))
+    struct.pack_into(ffmt, buf, HDR_LEN, *[_scale(fixed[i], fields[i]) for i in range(len(fixed))])
+    if tail:
+        struct.pack_into(tfmt, buf, HDR_LEN + struct.calcsize(ffmt), *[_scale(rep, v) for v in tail])
+    return buf
+
+# Unpacks the record at the passed offset.
+# Returns schema name, epoch, fields, repeated fields and next record offset.
+def decode(buf, off=0):
+    sync, id, epoch, n = struct.unpack_from(HDR, buf, off)
+    if sync != SYNC or id not in IDS:
+        raise ValueError('invalid record at {}'.format(off))
+    name = IDS[id]
+    fixed, rep = SCHEMAS[name][2:4]
+    off += HDR_LEN
+    ffmt = _fmt(fixed)
+    fields = struct.unpack_from(ffmt, buf, off)
+    off += struct.calcsize(ffmt)
+    tail = ()
+    if n > len(fixed):
+        tfmt = '<{}{}'.format(n - len(fixed), rep[0])
+        tail = struct.unpack_from(tfmt, buf, off)
+        off += struct.calcsize(tfmt)
+    return name, epoch, fields, tail, off
+
+def _str(spec, value):
+    if spec[1]:
+        value = value / spec[1]
+    if isinstance(spec[2], tuple):
+        return spec[2][value]
+    return spec[2].format(value)
+
+# Formats a decoded record as a csv data line.
+def csv(name, epoch, fields, tail=(), separator=','):
+    id, label, fixed, rep, layout = SCHEMAS[name]
+    fields = [_str(fixed[i], fields[i]) for i in range(len(fixed))]
+    tail = [_str(rep, v) for v in tail]
+    if layout:
+        fields = layout(fields, tail)
+    else:
+        fields.extend(tail)
+    return separator.join([label, str(epoch), iso8601(epoch)] + fields)
+
+# Iterates over the records of a binary data file content.
+def records(buf):
+    off = 0
+    while off + HDR_LEN <= len(buf):
+        try:
+            name, epoch, fields, tail, next = decode(buf, off)
+        except Exception:
+            off += 1  # Resyncs on the next record.
+            continue
+        yield name, epoch, fields, tail
+        off = next
@@ -0,0 +1,172 @@
+# tools/ringuart.py
+# MIT license; Copyright (c) 2021 Andrea Corbo
+
+# Uart reading through a ram ring buffer, drained from the uart buffer by the
+# uart idle irq and on every scheduler poll, so bursts arriving while the loop
+# is busy are kept instead of overrunning the uart buffer.
+# Presents the stream interface of the uart to StreamReader, StreamWriter
+# and select, reads wait for more bytes up to the uart timeouts as before.
+# The ring has a single writer, the drain, made reentrant safe by a flag, the
+# readers only move the read index.
+# Not for uarts read by others too, as the modem one shared with the login
+# listener, the drain would steal their bytes.
+# Counts the high watermark of the ring and the drains finding it full, each
+# one a chance for the uart buffer to overrun.
+
+import io
+import pyb
+
+MP_STREAM_POLL_RD = const(1)
+MP_STREAM_POLL_WR = const(4)
+MP_STREAM_POLL = const(3)
+MP_STREAM_ERROR = const(-1)
+
+class RINGUART(io.IOBase):
+
+    def __init__(self, uart, size):
+        self.uart = uart
+        self.buf = bytearray(size + 1)  # One byte tells full from empty.
+        self.mv = memoryview(self.buf)
+        self.rd = 0  # Read index, moved by readers only.
+        self.wr = 0  # Write index, moved by the drain only.
+        self.busy = False  # Drain running.
+        self.hwm = 0  # Max buffered bytes.
+        self.overruns = 0  # Drains finding the ring full.
+        self._arm()
+
+    def _arm(self):
+        try:
+            self.uart.irq(handler=self._drain, trigger=pyb.UART.IRQ_RXIDLE)
+        except (AttributeError, ValueError):
+            pass  # Drained on polls only.
+
+    # Buffered bytes.
+    def _cnt(self):
+        return (self.wr - self.rd) % len(self.buf)
+
+    # Moves the bytes waiting in the uart buffer to the ring.
+    def _drain(self, _=None):
+        if self.busy:
+            return  # Left to the running drain.
+        self.busy = True
+        try:
+            while True:
+                n = self.uart.any()
+                if not n:
+                    break
+                free = (self.rd - self.wr - 1) % len(self.buf)
+                if not free:
+                    self.overruns += 1
+                    break  # Left in the uart buffer.
+                n = min(n, free, len(self.buf) - self.wr)  # Never waits for more.
+                n = self.uart.readinto(self.mv[self.wr:self.wr + n])
+                if not n:
+                    break
+                self.wr = (self.wr + n) % len(self.buf)
+                if self._cnt() > self.hwm:
+                    self.hwm = self._cnt()
+        finally:
+            self.busy = False
+
+    def init(self, *args, **kwargs):
+        self.uart.init(*args, **kwargs)
+        self.rd = self.wr
+        self._arm()
+
+    def deinit(self):
+        self.uart.deinit()
+        self.rd = self.wr  # Drops buffered bytes.
+
+    def any(self):
+        self._drain()
+        return self._cnt()
+
+    # Moves up to n buffered bytes to the passed buffer.
+    def _copy(self, mv, n):
+        got = 0
+        while got < n and self._cnt():
+            k = min(n - got, self._cnt(), len(self.buf) - self.rd)
+            mv[got:got + k] = self.mv[self.rd:self.rd + k]
+            self.rd = (self.rd + k) % len(self.buf)
+            got += k
+        return got
+
+    # Reads up to n bytes, the buffered ones first, then from the uart waiting
+    # for more up to its timeouts, as the uart does.
+    def readinto(self, buf, n=-1):
+        mv = memoryview(buf)
+        if n < 0 or n > len(mv):
+            n = len(mv)
+        self._drain()
+        self.busy = True  # Uart bytes must not pass the buffered ones.
+        try:
+            got = self._copy(mv, n)
+            if got < n:
+                got += self.uart.readinto(mv[got:n]) or 0
+        finally:
+            self.busy = False
+        return got if got else None
+
+    def read(self, n=-1):
+        if n >= 0:
+            b = bytearray(n)
+            n = self.readinto(b)
+            return bytes(b[:n]) if n else None
+        b = bytearray(self.any())
+        self.busy = True
+        try:
+            self._copy(memoryview(b), len(b))
+            r = self.uart.read()  # All the rest.
+        finally:
+            self.busy = False
+        if r:
+            b.extend(r)
+        return bytes(b) if b else None
+
+    # Reads up to a new line included, from the uart if not buffered.
+    def readline(self):
+        self._drain()
+        cnt = self._cnt()
+        n = 0
+        while n < cnt:
+            n += 1
+            if self.buf[(self.rd + n - 1) % len(self.buf)] == 10:
+                b = bytearray(n)
+                self._copy(memoryview(b), n)
+                return bytes(b)
+        b = bytearray(cnt)
+        self.busy = True
+        try:
+            self._copy(memoryview(b), cnt)
+            r = self.uart.readline()
+        finally:
+            self.busy = False
+        if r:
+            b.extend(r)
+        return bytes(b) if b else None
+
+    # Moves the buffered bytes up to a new line included to the passed
+    # buffer, never waits. Returns the bytes moved, None if none.
+    def readlineinto(self, buf):
+        mv = memoryview(buf)
+        self._drain()
+        cnt = min(self._cnt(), len(mv))
+        n = 0
+        while n < cnt:
+            n += 1
+            if self.buf[(self.rd + n - 1) % len(self.buf)] == 10:
+                break
+        return self._copy(mv, n) if n else None
+
+    def write(self, buf):
+        return self.uart.write(buf)
+
+    def ioctl(self, req, arg):
+        ret = MP_STREAM_ERROR
+        if req == MP_STREAM_POLL:
+            ret = 0
+            if arg & MP_STREAM_POLL_RD and self.any():
+                ret |= MP_STREAM_POLL_RD
+            if arg & MP_STREAM_POLL_WR:
+                ret |= MP_STREAM_POLL_WR  # Writes block until sent.
+        return ret
@@ -0,0 +1,192 @@
+# tools/rs.py
+# MIT license; Copyright (c) 2021 Andrea Corbo
+
+# Reed-Solomon code over GF(256) (poly 0x11d, first root 1) protecting ymodem
+# packets. Buffers longer than a codeword are split into interleaved codewords,
+# byte i goes to codeword i % k, so error bursts spread over all of them.
+# Each codeword carries NSYM parity bytes and repairs up to NSYM // 2 wrong
+# bytes. On the board the encoder runs as viper code, the decoder is meant for
+# the remote and falls back to python.
+
+try:
+    import micropython
+except ImportError:
+    micropython = None
+
+NSYM = 8  # Parity bytes per codeword.
+MAX_DATA = 255 - NSYM  # Max data bytes per codeword.
+
+EXP = bytearray(512)  # Doubled, sums of two logs need no modulo.
+LOG = bytearray(256)
+_x = 1
+for _i in range(255):
+    EXP[_i] = EXP[_i + 255] = _x
+    LOG[_x] = _i
+    _x <<= 1
+    if _x & 0x100:
+        _x ^= 0x11d
+
+def _mul(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return EXP[LOG[a] + LOG[b]]
+
+def _div(a, b):
+    if a == 0:
+        return 0
+    return EXP[LOG[a] + 255 - LOG[b]]
+
+# Generator polynomial (x - 1)(x - a)...(x - a^(NSYM-1)), highest degree first,
+# as logs of its coefficients but the leading one.
+_gen = [1]
+for _i in range(NSYM):
+    _gen = [_c ^ _mul(_p, EXP[_i]) for _c, _p in zip(_gen + [0], [0] + _gen)]
+GEN = bytearray([LOG[_c] for _c in _gen[1:]])
+
+# Computes into par the parity of every step-th of the n bytes of buf, both
+# passed as views starting at the codeword, viper takes up to 4 arguments.
+if micropython:
+    @micropython.viper
+    def _parity(buf, n: int, step: int, par):
+        exp = ptr8(EXP)
+        log = ptr8(LOG)
+        gen = ptr8(GEN)
+        src = ptr8(buf)
+        dst = ptr8(par)
+        nsym = int(NSYM)
+        j = 0
+        while j < nsym:
+            dst[j] = 0
+            j += 1
+        i = 0
+        while i < n:
+            fb = src[i] ^ dst[0]
+            j = 0
+            while j < nsym - 1:
+                dst[j] = dst[j + 1]
+                j += 1
+            dst[nsym - 1] = 0
+            if fb:
+                lf = log[fb]
+                j = 0
+                while j < nsym:
+                    dst[j] ^= exp[lf + gen[j]]
+                    j += 1
+            i += step
+else:
+    def _parity(buf, n, step, par):
+        r = bytearray(NSYM)
+        for i in range(0, n, step):
+            fb = buf[i] ^ r[0]
+            r[:-1] = r[1:]
+            r[-1] = 0
+            if fb:
+                lf = LOG[fb]
+                for j in range(NSYM):
+                    r[j] ^= EXP[lf + GEN[j]]
+        par[:NSYM] = r
+
+# Codewords protecting n bytes.
+def words(n):
+    return (n + MAX_DATA - 1) // MAX_DATA
+
+# Parity bytes protecting n bytes.
+def size(n):
+    return words(n) * NSYM
+
+# Computes the parity of buf into par, size(len(buf)) bytes long.
+def encode(buf, par):
+    n = len(buf)
+    k = words(n)
+    src = memoryview(buf)
+    dst = memoryview(par)
+    for i in range(k):
+        _parity(src[i:], n - i, k, dst[i * NSYM:])
+
+# Repairs buf in place from its parity. Returns the count of repaired bytes,
+# -1 if there are too many errors to repair.
+def repair(buf, par):
+    n = len(buf)
+    k = words(n)
+    fixed = 0
+    for i in range(k):
+        cw = bytearray(buf[j] for j in range(i, n, k))
+        cw.extend(par[i * NSYM:(i + 1) * NSYM])
+        errs = _correct(cw)
+        if errs is None:
+            return -1
+        for p in errs:
+            if p < len(cw) - NSYM:
+                buf[i + p * k] = cw[p]
+        fixed += len(errs)
+    return fixed
+
+# Corrects a codeword in place, highest degree first. Returns the positions of
+# the corrected bytes, None if not correctable.
+def _correct(cw):
+    n = len(cw)
+    synd = []
+    for i in range(NSYM):
+        y = 0
+        for c in cw:
+            y = _mul(y, EXP[i]) ^ c
+        synd.append(y)
+    if not any(synd):
+        return []
+    # Error locator, lowest degree first (Berlekamp-Massey).
+    loc = [1]
+    old = [1]
+    l = 0
+    m = 1
+    b = 1
+    for r in range(NSYM):
+        d = synd[r]
+        for i in range(1, l + 1):
+            if i < len(loc):
+                d ^= _mul(loc[i], synd[r - i])
+        if d == 0:
+            m += 1
+            continue
+        coef = _div(d, b)
+        new = loc + [0] * max(0, len(old) + m - len(loc))
+        for i, c in enumerate(old):
+            new[i + m] ^= _mul(coef, c)
+        if 2 * l <= r:
+            old = loc
+            l = r + 1 - l
+            b = d
+            m = 1
+        else:
+            m += 1
+        loc = new
+    loc = loc[:l + 1]
+    if 2 * l > NSYM:
+        return None
+    # Error evaluator, syndromes times locator modulo x^NSYM.
+    ev = [0] * NSYM
+    for i, c in enumerate(loc):
+        for j in range(NSYM - i):
+            ev[i + j] ^= _mul(c, synd[j])
+    # Roots of the locator give positions (Chien), values by Forney.
+    pos = []
+    for p in range(n):
+        k = n - 1 - p  # Degree of the byte.
+        xi = EXP[(255 - k) % 255]  # Inverse of its locator.
+        y = 0
+        for c in reversed(loc):
+            y = _mul(y, xi) ^ c
+        if y:
+            continue
+        num = 0
+        for c in reversed(ev):
+            num = _mul(num, xi) ^ c
+        den = 0
+        for i in range(1, len(loc), 2):  # Formal derivative, odd terms.
+            den ^= _mul(loc[i], EXP[(LOG[xi] * (i - 1)) % 255])
+        if den == 0:
+            return None
+        cw[p] ^= _mul(EXP[k], _div(num, den))
+        pos.append(p)
+    if len(pos) != l:
+        return None
+    return pos
@@ -0,0 +1,247 @@
+# tools/sink.py
+# MIT license; Copyright (c) 2021 Andrea Corbo
+
+import time
+import os
+import struct
+from configs import dfl
+
+JRN_HDR = '<HHI'  # Record length, checksum, data file offset.
+JRN_HDR_LEN = struct.calcsize(JRN_HDR)
+
+def _chk(off, data):
+    return (sum(data) + len(data) + off + 0x5a5a) & 0xffff
+
+# Buffered single writer for the daily data files.
+# Records are collected in a ram ring buffer and written out to a file handle
+# that is kept open for the whole day, coalescing writes on sd sector boundaries.
+# If indexed, the offset of the first record of each label in each time bucket
+# is appended to a sidecar file as label,bucket,offset.
+# If journaled, each record is first appended to a fixed size journal file and
+# the buffer is committed to the data file in batches, when either the buffer
+# or the journal is full, or the data is stale.
+# If cataloged, the bytes written out are recorded in the passed catalog.
+class SINK:
+
+    def __init__(self, dir, name, size=dfl.DATA_BUF_LEN, index=False, journal=False, catalog=None):
+        self.dir = dir
+        self.name = name  # Callable returning the current file name.
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.head = 0  # First buffered byte.
+        self.cnt = 0  # Buffered bytes.
+        self.f = None  # Current file handle.
+        self.file = None  # Current file name.
+        self.pos = 0  # Current file size.
+        self.t = time.time()  # Last full flush.
+        self.index = index
+        self.idx = None  # Current index file handle.
+        self.buckets = {}  # Last indexed bucket by label.
+        self.entries = []  # Pending index entries.
+        self.journal = journal
+        self.jrn = None  # Current journal file handle.
+        self.jpos = 0  # Journal write position.
+        self.catalog = catalog
+
+    # Opens the passed file for appending, closing the previous one.
+    def open(self, file):
+        self.close()
+        try:
+            self.pos = os.stat(self.dir + '/' + file)[6]
+        except OSError:
+            self.pos = 0  # New file.
+        self.f = open(self.dir + '/' + file, 'ab')
+        self.file = file
+        if self.index:
+            self.idx = open(self.dir + '/' + file + dfl.INDEX_FILE_SFX, 'ab')
+            self.buckets = {}
+        if self.journal:
+            self.jrn = _journal(self.dir + '/' + file + dfl.JOURNAL_FILE_SFX)
+            self.jpos = 0
+
+    def close(self):
+        file = self.file
+        if self.f:
+            self.flush(True)
+            self.f.close()
+            self.f = None
+            self.file = None
+        if self.idx:
+            self.idx.close()
+            self.idx = None
+        if self.jrn:
+            self.jrn.close()
+            self.jrn = None
+            os.remove(self.dir + '/' + file + dfl.JOURNAL_FILE_SFX)  # All data is on file.
+
+    # Appends a record to the buffer, writes out data if needed.
+    def put(self, data, label=None, epoch=None):
+        if self.name() != self.file:
+            self.open(self.name())  # Flushes previous day and rolls over.
+        data = memoryview(data)
+        n = len(data)
+        if n > len(self.buf) - self.cnt or self.jrn and self.jpos + JRN_HDR_LEN + n > dfl.JOURNAL_LEN:
+            self.flush(True)
+        if self.idx and label:
+            self._mark(label, epoch)
+        if n > len(self.buf) or self.jrn and JRN_HDR_LEN + n > dfl.JOURNAL_LEN:
+            self._write(data)  # Record bigger than buffer.
+            self.f.flush()
+            self._index()
+            return
+        if self.jrn:
+            self._log(data)
+        tail = (self.head + self.cnt) % len(self.buf)
+        i = min(n, len(self.buf) - tail)
+        self.buf[tail:tail + i] = data[:i]
+        if i < n:
+            self.buf[:n - i] = data[i:]
+        self.cnt += n
+        if self.cnt >= dfl.DATA_FLUSH_LEN and not self.jrn:
+            self.flush()
+
+    # Writes out buffered data, up to the last complete sector unless full.
+    def flush(self, full=False):
+        if not self.f:
+            return
+        n = self.cnt
+        if not full:
+            n -= (self.pos + n) % dfl.SD_SECTOR
+            if n <= 0:
+                return
+        i = min(n, len(self.buf) - self.head)
+        self._write(self.mv[self.head:self.head + i])
+        if i < n:
+            self._write(self.mv[:n - i])
+        self.head = (self.head + n) % len(self.buf)
+        self.cnt -= n
+        if full:
+            self.t = time.time()
+        self.f.flush()
+        self._index()
+        if full:
+            self.jpos = 0  # Journaled data is on file.
+
+    def _write(self, data):
+        self.f.write(data)
+        self.pos += len(data)
+        if self.catalog:
+            self.catalog.grow(self.file, len(data))
+
+    # Appends a record to the journal.
+    def _log(self, data):
+        off = self.pos + self.cnt
+        self.jrn.seek(self.jpos)
+        self.jrn.write(struct.pack(JRN_HDR, len(data), _chk(off, data), off))
+        self.jrn.write(data)
+        self.jrn.flush()
+        self.jpos += JRN_HDR_LEN + len(data)
+
+    # Queues an index entry if the record opens a new time bucket.
+    def _mark(self, label, epoch):
+        bucket = epoch - epoch % dfl.INDEX_BUCKET
+        if label not in self.buckets or self.buckets[label] != bucket:
+            self.buckets[label] = bucket
+            self.entries.append((self.pos + self.cnt, label, bucket))
+
+    # Writes out entries of records already on file.
+    def _index(self):
+        while self.entries and self.entries[0][0] < self.pos:
+            off, label, bucket = self.entries.pop(0)
+            self.idx.write('{},{},{}\r\n'.format(label, bucket, off).encode())
+        if self.idx:
+            self.idx.flush()
+
+    # Called periodically, rolls over at midnight and flushes stale data.
+    def tick(self):
+        if self.file and self.name() != self.file:
+            self.open(self.name())  # Pre-opens the new daily file.
+        elif time.time() - self.t >= dfl.DATA_FLUSH_INTERVAL:
+            self.flush(True)
+
+# Opens a journal, preallocating it to avoid cluster allocations on writes.
+def _journal(path):
+    try:
+        if os.stat(path)[6] >= dfl.JOURNAL_LEN:
+            return open(path, 'r+b')
+    except OSError:
+        pass
+    with open(path, 'wb') as f:
+        f.write(bytearray(dfl.JOURNAL_LEN))
+    return open(path, 'r+b')
+
+# Cuts a file to the passed size by copying it.
+def _truncate(path, size):
+    buf = bytearray(dfl.SD_SECTOR)
+    mv = memoryview(buf)
+    with open(path, 'rb') as src:
+        with open(path + '.tmp', 'wb') as dst:
+            while size:
+                n = src.readinto(mv[:min(size, len(buf))])
+                if not n:
+                    break
+                dst.write(mv[:n])
+                size -= n
+    os.remove(path)
+    os.rename(path + '.tmp', path)
+
+# Replays the journal of a data file after an unclean shutdown.
+# Torn entries are dropped, data on file not matching the journal is truncated
+# and missing data is appended. Returns truncated and appended bytes.
+# Raises ValueError if the file ends before the journal starts, appending
+# would shift the data, the journal is to be set aside for recovery by hand.
+def replay(dir, file):
+    path = dir + '/' + file
+    try:
+        os.stat(path)
+    except OSError:
+        try:
+            os.stat(dir + '/' + dfl.SENT_FILE_PFX + file)
+            path = dir + '/' + dfl.SENT_FILE_PFX + file  # Archived meanwhile.
+        except OSError:
+            pass
+    with open(dir + '/' + file + dfl.JOURNAL_FILE_SFX, 'rb') as f:
+        jrn = f.read()
+    mv = memoryview(jrn)
+    entries = []
+    pos = 0
+    next = None
+    while pos + JRN_HDR_LEN <= len(jrn):
+        n, chk, off = struct.unpack_from(JRN_HDR, jrn, pos)
+        data = mv[pos + JRN_HDR_LEN:pos + JRN_HDR_LEN + n]
+        if not n or len(data) < n or next is not None and off != next or _chk(off, data) != chk:
+            break  # Torn or stale entry.
+        entries.append((off, data))
+        next = off + n
+        pos += JRN_HDR_LEN + n
+    if not entries:
+        return 0, 0
+    try:
+        size = os.stat(path)[6]
+    except OSError:
+        size = 0
+    good = size
+    if size > entries[0][0]:
+        with open(path, 'rb') as f:
+            f.seek(entries[0][0])
+            for off, data in entries:
+                if off >= size:
+                    break
+                chunk = f.read(min(len(data), size - off))
+                if chunk != bytes(data[:len(chunk)]):
+                    k = 0
+                    while chunk[k] == data[k]:
+                        k += 1
+                    good = off + k  # First byte not matching.
+                    break
+    if good < entries[0][0]:
+        raise ValueError('{} bytes missing before the journal of {}'.format(entries[0][0] - good, file))
+    if good < size:
+        _truncate(path, good)
+    appended = 0
+    with open(path, 'ab') as f:
+        for off, data in entries:
+            if off + len(data) > good:
+                f.write(data[max(0, good - off):])
+                appended += off + len(data) - max(good, off)
+    return size - good, appended
@@ -0,0 +1,72 @@
+# tools/stats.py
+# MIT license; Copyright (c) 2021 Andrea Corbo
+#
+# Data call telemetry, filled by the modem while calling and by the ymodem
+# engine while transferring, logged as a $MODEM record at the end of the call.
+
+import time
+
+last = None  # Stats of the last data call, shown by the menu.
+
+# Returns the ms elapsed since the passed ticks.
+def elapsed(start):
+    return time.ticks_diff(time.ticks_ms(), start)
+
+class STATS:
+
+    def __init__(self):
+        self.epoch = time.time()  # Call start.
+        self.calls = 0  # Call attempts.
+        self.call_ms = 0  # Time spent calling.
+        self.send_ms = 0  # Time spent sending files.
+        self.recv_ms = 0  # Time spent receiving files.
+        self.cts_ms = 0  # Time spent waiting for clear to send.
+        self.tx_bytes = 0  # Acknowledged bytes sent.
+        self.rx_bytes = 0  # Bytes received.
+        self.packets = 0  # Data packets sent.
+        self.resent = 0  # Data packets sent again.
+        self.naks = 0  # Naks received.
+        self.timeouts = 0  # Replies timed out.
+        self.files = []  # Sent files [name, bytes, ms].
+        self.result = 0  # 1 if the call succeeded.
+
+    # Effective sending throughput [B/s].
+    def throughput(self):
+        return self.tx_bytes * 1000 / self.send_ms if self.send_ms else 0
+
+    # Record fields, must follow the MODEM schema in tools.record.
+    def fields(self):
+        return [
+            self.calls,
+            self.call_ms,
+            self.send_ms,
+            self.recv_ms,
+            self.cts_ms,
+            self.tx_bytes,
+            self.throughput(),
+            self.rx_bytes,
+            self.packets,
+            self.resent,
+            self.naks,
+            self.timeouts,
+            len(self.files),
+            self.result
+            ]
+
+    # Per file bytes and ms, repeated fields of the record.
+    def tail(self):
+        t = []
+        for f in self.files:
+            t.extend(f[1:])
+        return t
+
+    def report(self):
+        _ = [
+            "CALL ATTEMPTS {}, {} ms, {}".format(self.calls, self.call_ms, 'OK' if self.result else 'FAILED'),
+            "SENT {} B IN {} ms, {:.1f} B/s, CTS {} ms".format(self.tx_bytes, self.send_ms, self.throughput(), self.cts_ms),
+            "RECEIVED {} B IN {} ms".format(self.rx_bytes, self.recv_ms),
+            "PACKETS {}, RESENT {}, NAKS {}, TIMEOUTS {}".format(self.packets, self.resent, self.naks, self.timeouts)
+            ]
+        for f in self.files:
+            _.append("{: <20} {: >8} B {: >8} ms".format(*f))
+        return _
@@ -1,160 +1,344 @@
-# tools/utils.py
-# MIT license; Copyright (c) 2020 Andrea Corbo
-
-import uasyncio as asyncio
-from primitives.message import Message
-from primitives.semaphore import Semaphore
-from primitives.queue import Queue
-import time
-import os
-import json
-import _thread
-import pyb
-from configs import dfl, cfg
-
-logger = True  # Prints out messages.
-
-f_lock = asyncio.Lock()  # Data file lock.
-alert = Message()  # Sms message.
-trigger = Message()
-timesync = asyncio.Event()  # Gps fix event.
-scheduling = asyncio.Event()  # Scheduler event.
-disconnect = asyncio.Event()  # Modem event.
-u2_lock = asyncio.Lock() # Uart 2 lock.
-u4_lock = asyncio.Lock() # Uart 4 lock.
-
-def welcome_msg():
-    print(
-    '{:#^80}\n\r#{: ^78}#\n\r#{: ^78}#\n\r# {: <20}{: <57}#\n\r# {: <20}{: <57}#\n\r# {: <20}{: <57}#\n\r# {: <20}{: <57}#\n\r{:#^80}'.format(
-        '',
-        'WELCOME TO ' + cfg.HOSTNAME + ' ' + dfl.SW_NAME + ' ' + dfl.SW_VERSION,
-        '',
-        ' current time:',
-        iso8601(time.time()),
-        ' machine:',
-        os.uname()[4],
-        ' mpy release:',
-        os.uname()[2],
-        ' mpy version:',
-        os.uname()[3],
-        ''))
-
-# Prints out extensive messages.
-def verbose(msg):
-    if cfg.VERBOSE:
-        print(msg)
-
-# Reads out an device config file.
-def read_cfg(file):
-    try:
-        with open(dfl.CONFIG_DIR + file + dfl.CONFIG_TYPE) as cfg:
-            return json.load(cfg)
-    except:
-        log('Unable to read file {}'.format(file), type='e')
-
-# Converts embedded epoch 2000-01-01T00:00:00Z to unix epoch 1970-01-01T00:00:00Z.
-def unix_epoch(epoch):
-    return 946684800 + epoch
-
-# Formats utc dates according to iso8601 standardization yyyy-mm-ddThh:mm:ssZ
-def iso8601(timestamp):
-    return '{}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}Z'.format(
-    time.localtime(timestamp)[0],
-    time.localtime(timestamp)[1],
-    time.localtime(timestamp)[2],
-    time.localtime(timestamp)[3],
-    time.localtime(timestamp)[4],
-    time.localtime(timestamp)[5])
-
-async def blink(led, dutycycle=50 ,period=1000 , **kwargs):
-    while True:
-        if kwargs and 'cancel_evt' in kwargs and kwargs['cancel_evt'].is_set():
-            await asyncio.sleep(0)
-            return
-        if kwargs and 'stop_evt' in kwargs:
-            while kwargs['stop_evt'].is_set():
-                await asyncio.sleep(0)
-                continue
-        if kwargs and 'start_evt' in kwargs:
-            await kwargs['start_evt'].wait()
-        onperiod = period // 100 * dutycycle
-        pyb.LED(led).on()
-        await asyncio.sleep_ms(onperiod)
-        pyb.LED(led).off()
-        await asyncio.sleep_ms(period - onperiod)
-
-def msg(msg=None):
-    if msg is None:
-        print('')
-    elif msg == '-':
-        print('{:#^80}\n'.format(''))
-    else:
-        print('\n{:#^80}'.format(msg))
-
-def log(*args, **kwargs):
-    def fwriter():
-        try:
-            with open(dfl.LOG_DIR + '/' + dfl.LOG_FILE, 'a') as f:
-                f.write('{},{},{}\r\n'.format(
-                timestamp,
-                args[0],
-                ' '.join(map(str, args[1:]))))
-        except Exception as err:
-            print(err)
-
-    type = 'm'
-    if kwargs and 'type' in kwargs:
-        type = kwargs['type']
-    timestamp = iso8601(time.time())
-    if logger:  # Global flag.
-        print('{: <22}{: <8}{}'.format(
-        timestamp, args[0],
-        ' '.join(map(str, args[1:]))))
-    if cfg.LOG_TO_FILE:
-        if type in cfg.LOG_LEVEL:
-            _thread.start_new_thread(fwriter,())
-
-# Set alert msg, caught by alerter.
-def set_alert(text):
-    global alert
-    alert.set(text)
-
-def dailyfile():
-    # YYYYMMDD
-    return '{:04d}{:02d}{:02d}'.format(
-        time.localtime()[0],
-        time.localtime()[1],
-        time.localtime()[2]
-        )
-
-async def log_data(data):
-    global f_lock
-    evt = asyncio.Event()  # Event to wait for thread completion.
-    def fwriter():
-        try:
-            with open(dfl.DATA_DIR + '/' + dailyfile(), 'a') as f:
-                f.write('{}\r\n'.format(data))
-                log(data)
-        except Exception as err:
-            log(type(err).__name__, err, type='e')
-        evt.set()
-
-    async with f_lock:
-        _thread.start_new_thread(fwriter, ())
-        await asyncio.sleep_ms(10)
-        await evt.wait()
-        evt.clear()
-
-def files_to_send():
-    for f in sorted(os.listdir(dfl.DATA_DIR)):
-        try:
-            int(f)  # Names of unsent datafiles are integer YYYYMMDD.
-        except ValueError:
-            continue
-        if (time.mktime(time.localtime())
-            - time.mktime([int(f[0:4]),int(f[4:6]),int(f[6:8]),0,0,0,0,0])
-            < cfg.BUF_DAYS * 86400):
-            yield dfl.DATA_DIR + '/' + f  # Skips files older than BUF_DAYS.
-    if dfl.LOG_FILE in os.listdir(dfl.LOG_DIR):
-        yield dfl.LOG_DIR + '/' + dfl.LOG_FILE  # Sends last log file.
-    yield '\x00'  # Null file is needed to end ymodem transmission.
+# tools/utils.py
+# MIT license; Copyright (c) 2020 Andrea Corbo
+
+import uasyncio as asyncio
+from primitives.message import Message
+from primitives.semaphore import Semaphore
+from primitives.queue import Queue
+from tools.sink import SINK, replay
+from tools.inventory import inventory
+from tools.executor import executor
+import tools.record as record
+import time
+import os
+import json
+import _thread
+import pyb
+from configs import dfl, cfg
+
+logger = True  # Prints out messages.
+
+f_lock = asyncio.Lock()  # Data file lock.
+alert = Message()  # Sms message.
+trigger = Message()
+timesync = asyncio.Event()  # Gps fix event.
+scheduling = asyncio.Event()  # Scheduler event.
+disconnect = asyncio.Event()  # Modem event.
+u2_lock = asyncio.Lock() # Uart 2 lock.
+u4_lock = asyncio.Lock() # Uart 4 lock.
+
+def welcome_msg():
+    print(
+    '{:#^80}\n\r#{: ^78}#\n\r#{: ^78}#\n\r# {: <20}{: <57}#\n\r# {: <20}{: <57}#\n\r# {: <20}{: <57}#\n\r# {: <20}{: <57}#\n\r{:#^80}'.format(
+        '',
+        'WELCOME TO ' + cfg.HOSTNAME + ' ' + dfl.SW_NAME + ' ' + dfl.SW_VERSION,
+        '',
+        ' current time:',
+        iso8601(time.time()),
+        ' machine:',
+        os.uname()[4],
+        ' mpy release:',
+        os.uname()[2],
+        ' mpy version:',
+        os.uname()[3],
+        ''))
+
+# Prints out extensive messages.
+def verbose(msg):
+    if cfg.VERBOSE:
+        print(msg)
+
+# Reads out an device config file.
+def read_cfg(file):
+    try:
+        with open(dfl.CONFIG_DIR + file + dfl.CONFIG_TYPE) as cfg:
+            return json.load(cfg)
+    except:
+        log('Unable to read file {}'.format(file), type='e')
+
+# Converts embedded epoch 2000-01-01T00:00:00Z to unix epoch 1970-01-01T00:00:00Z.
+def unix_epoch(epoch):
+    return 946684800 + epoch
+
+# Formats utc dates according to iso8601 standardization yyyy-mm-ddThh:mm:ssZ
+def iso8601(timestamp):
+    return '{}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}Z'.format(
+    time.localtime(timestamp)[0],
+    time.localtime(timestamp)[1],
+    time.localtime(timestamp)[2],
+    time.localtime(timestamp)[3],
+    time.localtime(timestamp)[4],
+    time.localtime(timestamp)[5])
+
+async def blink(led, dutycycle=50 ,period=1000 , **kwargs):
+    while True:
+        if kwargs and 'cancel_evt' in kwargs and kwargs['cancel_evt'].is_set():
+            await asyncio.sleep(0)
+            return
+        if kwargs and 'stop_evt' in kwargs:
+            while kwargs['stop_evt'].is_set():
+                await asyncio.sleep(0)
+                continue
+        if kwargs and 'start_evt' in kwargs:
+            await kwargs['start_evt'].wait()
+        onperiod = period // 100 * dutycycle
+        pyb.LED(led).on()
+        await asyncio.sleep_ms(onperiod)
+        pyb.LED(led).off()
+        await asyncio.sleep_ms(period - onperiod)
+
+def msg(msg=None):
+    if msg is None:
+        print('')
+    elif msg == '-':
+        print('{:#^80}\n'.format(''))
+    else:
+        print('\n{:#^80}'.format(msg))
+
+log_lines = []  # Log lines to write out.
+log_queued = False  # Log writer queued.
+log_lock = _thread.allocate_lock()  # Guards the lines and the flag, never held on io.
+log_wlock = _thread.allocate_lock()  # Keeps the log lines in order among workers.
+
+# Writes out the pending log lines in batches, runs in a worker thread.
+def fwriter():
+    global log_lines, log_queued
+    with log_wlock:
+        try:
+            with open(dfl.LOG_DIR + '/' + dfl.LOG_FILE, 'a') as f:
+                while True:
+                    with log_lock:
+                        lines = log_lines
+                        log_lines = []
+                        if not lines:
+                            log_queued = False  # Lines logged from now on need a new writer.
+                            return
+                    f.write(''.join(lines))
+        except Exception as err:
+            with log_lock:
+                log_lines = []
+                log_queued = False
+            print(err)
+
+def log(*args, **kwargs):
+    global log_queued
+    type = 'm'
+    if kwargs and 'type' in kwargs:
+        type = kwargs['type']
+    timestamp = iso8601(time.time())
+    if logger:  # Global flag.
+        print('{: <22}{: <8}{}'.format(
+        timestamp, args[0],
+        ' '.join(map(str, args[1:]))))
+    if cfg.LOG_TO_FILE:
+        if type in cfg.LOG_LEVEL:
+            line = '{},{},{}\r\n'.format(
+            timestamp,
+            args[0],
+            ' '.join(map(str, args[1:])))
+            with log_lock:
+                log_lines.append(line)
+                post = not log_queued
+                log_queued = True
+            if post and executor.post(fwriter) is None:
+                with log_lock:
+                    log_queued = False  # Retried on the next line if full.
+
+# Set alert msg, caught by alerter.
+def set_alert(text):
+    global alert
+    alert.set(text)
+
+def dailyfile():
+    # YYYYMMDD
+    return '{:04d}{:02d}{:02d}'.format(
+        time.localtime()[0],
+        time.localtime()[1],
+        time.localtime()[2]
+        )
+
+def binfile():
+    # YYYYMMDD.bin
+    return dailyfile() + dfl.BIN_FILE_SFX
+
+sink = SINK(dfl.DATA_DIR, dailyfile, index=True, journal=dfl.DATA_JOURNAL, catalog=inventory)  # Data files writer.
+bsink = SINK(dfl.DATA_DIR, binfile, journal=dfl.DATA_JOURNAL, catalog=inventory)  # Binary data files writer.
+
+async def log_data(data):
+    global f_lock
+    fields = data.split(dfl.DATA_SEPARATOR, 2)
+    try:
+        epoch = int(fields[1])
+    except (IndexError, ValueError):
+        epoch = unix_epoch(time.time())  # Records without epoch (nmea).
+    async with f_lock:
+        try:
+            sink.put('{}\r\n'.format(data).encode(), fields[0], epoch)
+        except Exception as err:
+            log(type(err).__name__, err, type='e')
+    log(data)
+
+# Logs a binary record, fields must follow the driver schema in tools.record.
+async def log_record(name, epoch, fields, tail=()):
+    global f_lock
+    async with f_lock:
+        try:
+            bsink.put(record.encode(name, epoch, fields, tail))
+        except Exception as err:
+            log(type(err).__name__, err, type='e')
+    verbose('{} {} {}'.format(name, epoch, fields))
+
+# Flushes out buffered data and rolls over daily files at midnight.
+async def flusher():
+    global f_lock
+    while True:
+        await asyncio.sleep(min(dfl.DATA_FLUSH_INTERVAL, 86400 - time.time() % 86400))
+        async with f_lock:
+            try:
+                sink.tick()
+                bsink.tick()
+                inventory.save()
+            except Exception as err:
+                log(type(err).__name__, err, type='e')
+
+# Replays data journals left by an unclean shutdown, must run before logging.
+def recover():
+    for f in os.listdir(dfl.DATA_DIR):
+        if not f.endswith(dfl.JOURNAL_FILE_SFX):
+            continue
+        file = f[:-len(dfl.JOURNAL_FILE_SFX)]
+        try:
+            cut, added = replay(dfl.DATA_DIR, file)
+            if cut or added:
+                log('{} recovered, {} bytes truncated, {} bytes restored'.format(file, cut, added), type='e')
+                if file + dfl.INDEX_FILE_SFX in os.listdir(dfl.DATA_DIR):
+                    rebuild_index(file)
+            os.remove(dfl.DATA_DIR + '/' + f)
+        except ValueError as err:
+            log(type(err).__name__, err, type='e')
+            _aside(dfl.DATA_DIR + '/' + f)
+        except Exception as err:
+            log(type(err).__name__, err, type='e')
+
+# Sets aside a journal failing to replay, the sink would reuse and overwrite
+# it. Keeps the last one.
+def _aside(path):
+    try:
+        os.remove(path + dfl.BAD_FILE_SFX)
+    except OSError:
+        pass
+    try:
+        os.rename(path, path + dfl.BAD_FILE_SFX)
+    except Exception as err:
+        log(type(err).__name__, err, type='e')
+
+# Returns the path of the passed day data file, either unsent or archived.
+def datafile(day):
+    for f in (day, dfl.SENT_FILE_PFX + day):
+        try:
+            os.stat(dfl.DATA_DIR + '/' + f)
+            return dfl.DATA_DIR + '/' + f
+        except OSError:
+            pass
+
+# Scans a daily file and rewrites its index.
+def rebuild_index(day):
+    idx = []
+    file = datafile(day)
+    if not file:
+        return idx
+    buckets = {}
+    epoch = 0
+    off = 0
+    with open(file, 'rb') as f:
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            fields = line.split(dfl.DATA_SEPARATOR.encode(), 2)
+            label = fields[0].decode()
+            try:
+                epoch = int(fields[1])
+            except (IndexError, ValueError):
+                pass  # Records without epoch (nmea) take the previous one.
+            bucket = epoch - epoch % dfl.INDEX_BUCKET
+            if label not in buckets or buckets[label] != bucket:
+                buckets[label] = bucket
+                idx.append((label, bucket, off))
+            off += len(line)
+    with open(dfl.DATA_DIR + '/' + day + dfl.INDEX_FILE_SFX, 'w') as f:
+        for entry in idx:
+            f.write('{},{},{}\r\n'.format(*entry))
+    log('index of {} rebuilt'.format(day))
+    return idx
+
+# Reads out the index of a daily file as a list of (label, bucket, offset).
+def read_index(day):
+    if day == sink.file:
+        sink.flush(True)  # Writes out pending entries.
+    idx = []
+    try:
+        with open(dfl.DATA_DIR + '/' + day + dfl.INDEX_FILE_SFX) as f:
+            for line in f:
+                entry = line.strip().split(',')
+                idx.append((entry[0], int(entry[1]), int(entry[2])))
+    except OSError:
+        return rebuild_index(day)
+    return idx
+
+# Iterates over the data lines of the passed day, optionally selected by
+# label and by epoch between start and end.
+def records(day, label=None, start=None, end=None):
+    first = None
+    stop = None
+    for l, bucket, off in read_index(day):
+        if (label is None or l == label) and (start is None or bucket + dfl.INDEX_BUCKET > start):
+            if first is None or off < first:
+                first = off
+        if end is not None and bucket > end:
+            if stop is None or off < stop:
+                stop = off
+    if first is None:
+        return
+    with open(datafile(day), 'rb') as f:
+        f.seek(first)
+        while stop is None or f.tell() < stop:
+            line = f.readline()
+            if not line:
+                break
+            fields = line.decode().strip().split(dfl.DATA_SEPARATOR, 2)
+            if label is not None and fields[0] != label:
+                continue
+            try:
+                epoch = int(fields[1])
+                if start is not None and epoch < start or end is not None and epoch > end:
+                    continue
+            except (IndexError, ValueError):
+                pass  # Records without epoch (nmea) are selected by bucket.
+            yield dfl.DATA_SEPARATOR.join(fields)
+
+# Returns the last data line of the passed label, today if no day is passed.
+def last_record(label, day=None):
+    if day is None:
+        day = dailyfile()
+    last = None
+    for l, bucket, off in read_index(day):
+        if l == label and (last is None or bucket > last):
+            last = bucket
+    if last is None:
+        return None
+    line = None
+    for line in records(day, label, last):
+        pass
+    return line
+
+def files_to_send():
+    for e in inventory.entries(unsent=True):
+        f = e[0]
+        if (time.mktime(time.localtime())
+            - time.mktime([int(f[0:4]),int(f[4:6]),int(f[6:8]),0,0,0,0,0])
+            < cfg.BUF_DAYS * 86400):
+            yield dfl.DATA_DIR + '/' + f  # Skips files older than BUF_DAYS.
+    if dfl.LOG_FILE in os.listdir(dfl.LOG_DIR):
+        yield dfl.LOG_DIR + '/' + dfl.LOG_FILE  # Sends last log file.
+    yield '\x00'  # Null file is needed to end ymodem transmission.
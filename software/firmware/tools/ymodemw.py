@@ -0,0 +1,216 @@
+# tools/ymodemw.py
+# MIT license; Copyright (c) 2021 Andrea Corbo
+#
+# Windowed ymodem sender.
+# The remote announces the mode replying to the modem preamble with SYN and
+# the max number of packets it accepts in flight, instead of ACK. The buoy
+# replies SYN and the agreed window, 0 or 1 falling back to plain ymodem.
+# File name packets, EOT and the end of transmission are plain ymodem, while
+# data packets are streamed up to the window and the remote replies to each
+# one with ACK or NAK followed by the packet sequence. NAKs, timeouts and
+# packets left without reply when a later one gets it resend the single
+# packet. The remote writes out packets in sequence order.
+# When adapting, packets keep the size they were built with, the new size
+# applies to the packets read out next.
+# The remote asks for error correction setting the FEC bit of its window,
+# granted by the buoy in its reply. Data packets, stop and wait ones too, are
+# then followed by reed-solomon parity (tools/rs.py) the remote repairs them
+# with instead of replying NAK.
+# The ZIP and BDL bits of the window likewise tell the remote inflates
+# compressed files and unpacks bundles (tools/bundle.py). Files are sent plain
+# and one by one unless granted, remotes replying ACK to the preamble get
+# neither.
+
+import uasyncio as asyncio
+import time
+from tools.utils import verbose
+from tools.stats import elapsed
+from tools.ymodem import YMODEM, ACK, NAK, CAN
+from tools.executor import executor
+
+SYN = b'\x16'  # 22
+MAX_WINDOW = 16  # Max packets in flight, much less than 256 sequences.
+FEC = 0x80  # Error correction bit of the window byte.
+ZIP = 0x40  # Compression bit of the window byte.
+BDL = 0x20  # Bundling bit of the window byte.
+WIN = 0x1f  # Window bits of the window byte.
+
+class YMODEMW(YMODEM):
+
+    def __init__(self, agetc, aputc, window=0, **kwargs):
+        YMODEM.__init__(self, agetc, aputc, **kwargs)
+        self.window = window  # Agreed packets in flight, stop and wait below 2.
+
+    # Agrees the window, error correction, compression and bundling with the
+    # remote, called on its SYN to the preamble.
+    async def negotiate(self, max_window, fec=False, timeout=10, compress=False, bundle=False):
+        w = await self.agetc(1, timeout)
+        if not w:
+            return False
+        self.window = min(w[0] & WIN, max_window, MAX_WINDOW)
+        self.fec = bool(fec and w[0] & FEC)
+        self.compress = bool(compress and w[0] & ZIP)
+        self.bundle = bool(bundle and w[0] & BDL)
+        verbose('<-- SYN, WINDOW {}{}'.format(w[0] & WIN, _caps(w[0])))
+        w = self.window | (FEC if self.fec else 0) | (ZIP if self.compress else 0) | (BDL if self.bundle else 0)
+        if not await self.aputc(SYN + bytes([w]), timeout):
+            return False
+        verbose('SYN, WINDOW {}{} -->'.format(self.window, _caps(w)))
+        return True
+
+    # Falls back to plain ymodem, called on the ACK of the remote to the
+    # preamble.
+    def plain(self):
+        self.window = 0
+        self.fec = False
+        self.compress = False
+        self.bundle = False
+
+    ############################################################################
+    # Windowed data sender.
+    ############################################################################
+    async def send_data(self, s, ptr, end, sz, crc_mode, ck):
+        if self.window < 2:
+            return await YMODEM.send_data(self, s, ptr, end, sz, crc_mode, ck)
+
+        tx = 0  # Transmissions counter.
+        out = 0  # Transmissions waiting for reply.
+
+        # Sends the passed packet.
+        async def put(p, again=False):
+            nonlocal tx, out
+            tx += 1
+            p[4] = tx
+            p[6] = None if again else time.ticks_ms()  # No round trip on resent packets.
+            out += 1
+            if again:
+                self.stats.resent += 1
+            if not await self.aputc(p[1][p[5]][0], self.tout):
+                return False
+            verbose('PACKET {} -->'.format(p[0]))
+            return True
+
+        # Packets in flight and next one
+        # [seq, buffers, pointer, acked, transmission, size, sent ticks].
+        free = [[0, b, 0, False, None, sz, None] for b in self.pkt_bufs(self.window + 1, sz, crc_mode)]
+        flight = []  # Unacked packets.
+        seq = 1
+        eof = False
+        ec = 0  # Error counter.
+        cc = 0  # Cancel counter.
+        rptr = ptr  # Pointer of the next packet.
+        nb = free.pop()  # Slot of the next packet.
+        nb[5] = self.psz
+        nxt = await executor.submit(self.mk_data,s,rptr,end,seq,nb[5],crc_mode,nb[1])  # Next packet.
+        while True:
+            if ec > self.retry:
+                verbose('TOO MANY ERRORS, ABORTING...')
+                return False
+            #
+            # Fills the window.
+            #
+            while not eof and len(flight) < self.window:
+                tptr = await nxt.result()
+                if tptr is None:
+                    verbose('ERROR READING FILE')
+                    return False
+                if tptr == rptr:
+                    verbose('EOF')
+                    eof = True
+                    break
+                nb[0] = seq
+                nb[2] = rptr = tptr
+                nb[3] = False
+                nb[4] = None
+                flight.append(nb)
+                seq = (seq + 1) % 0x100
+                nb = free.pop()
+                nb[5] = self.psz
+                nxt = await executor.submit(self.mk_data,s,rptr,end,seq,nb[5],crc_mode,nb[1])
+                self.stats.packets += 1
+                if not await put(flight[-1]):
+                    ec += 1  # Resent on timeout.
+            if not flight:
+                break  # All packets acknowledged.
+            #
+            # Waits for replies.
+            #
+            c = await self.agetc(1, self.rto)
+            if not c:
+                verbose('TIMEOUT OCCURRED, RETRY...')
+                self.stats.timeouts += 1
+                ec += 1
+                out = 0  # Replies got lost.
+                self.failed(True)
+                await ck.save()  # The link may be gone.
+                await put(flight[0], True)  # Resends the oldest packet.
+                continue
+            if c == CAN:
+                verbose('<-- CAN')
+                if cc:
+                    verbose('TRANSMISSION CANCELED BY RECEIVER')
+                    return False
+                cc = 1
+                continue  # Waits for a second CAN.
+            if c not in (ACK, NAK):
+                verbose('UNATTENDED CHAR {}, RETRY...'.format(c))
+                ec += 1
+                continue
+            n = await self.agetc(1, self.rto)
+            if not n:
+                ec += 1
+                continue
+            out = max(out - 1, 0)
+            p = None
+            for q in flight:
+                if q[0] == n[0]:
+                    p = q
+                    break
+            if not p or p[4] is None:
+                continue  # Reply to a duplicated packet.
+            t = p[4]
+            p[4] = None
+            # Replies come in order, packets sent before and still waiting
+            # got lost.
+            for q in flight:
+                if q[4] is not None and q[4] < t:
+                    verbose('PACKET {} LOST'.format(q[0]))
+                    out = max(out - 1, 0)
+                    ec += 1
+                    self.failed()
+                    await put(q, True)
+            if c == ACK:
+                verbose('<-- ACK TO PACKET {}'.format(p[0]))
+                self.acked(elapsed(p[6]) if p[6] is not None else None)
+                p[3] = True
+                ec = 0
+                cc = 0
+                # Slides the window over the acknowledged packets.
+                if flight[0][3]:
+                    k = 0
+                    while flight and flight[0][3]:
+                        q = flight.pop(0)
+                        self.stats.tx_bytes += q[2] - ptr
+                        ptr = q[2]
+                        free.append(q)  # Buffer gets reused.
+                        k += 1
+                    await ck.ack(ptr, k)
+            else:
+                verbose('<-- NAK TO PACKET {}'.format(p[0]))
+                self.stats.naks += 1
+                ec += 1
+                self.failed()
+                await put(p, True)  # Resends the packet.
+        #
+        # Drains replies to duplicated packets.
+        #
+        while out:
+            c = await self.agetc(2, self.rto)
+            if not c:
+                break
+            out -= 1
+        return True
+
+# Capabilities set in a window byte, for logging.
+def _caps(w):
+    return ''.join(', ' + n for b, n in ((FEC, 'FEC'), (ZIP, 'ZIP'), (BDL, 'BDL')) if w & b)
@@ -69,11 +69,11 @@ def sleep(t):
 class IOQueue:
     def __init__(self):
         self.poller = select.poll()
-        self.map = {}  # maps id(stream) to [task_waiting_read, task_waiting_write, stream]
+        self.map = {}  # maps id(stream) to [task_waiting_read, task_waiting_write, stream, read_deadline, write_deadline]
 
     def _enqueue(self, s, idx):
         if id(s) not in self.map:
-            entry = [None, None, s]
+            entry = [None, None, s, False, False]
             entry[idx] = cur_task
             self.map[id(s)] = entry
             self.poller.register(s, select.POLLIN if idx == 0 else select.POLLOUT)
@@ -90,17 +90,52 @@ class IOQueue:
         del self.map[id(s)]
         self.poller.unregister(s)
 
-    def queue_read(self, s):
-        self._enqueue(s, 0)
-
-    def queue_write(self, s):
-        self._enqueue(s, 1)
+    # Queues the current task to read (idx 0) or write (idx 1) s. With a
+    # ticks deadline the task is also queued on _task_queue, woken up by the
+    # stream or by the deadline, whichever comes first. It is linked to
+    # _task_queue only, a cancel wakes it up and dequeue_io unlinks it.
+    def queue_io(self, s, idx, deadline=None):
+        self._enqueue(s, idx)
+        if deadline is not None:
+            _task_queue.push_sorted(cur_task, deadline)
+            self.map[id(s)][3 + idx] = True
+
+    # Unlinks the current task waiting on s until a deadline, returns True if
+    # it was still waiting, so woken up by the deadline.
+    def dequeue_io(self, s, idx):
+        sm = self.map.get(id(s))
+        if sm is None or sm[idx] is not cur_task:
+            return False
+        sm[idx] = None
+        sm[3 + idx] = False
+        if sm[1 - idx] is None:
+            self._dequeue(s)
+        else:
+            self.poller.modify(s, select.POLLOUT if idx == 0 else select.POLLIN)
+        return True
+
+    def queue_read(self, s, deadline=None):
+        self.queue_io(s, 0, deadline)
+
+    def queue_write(self, s, deadline=None):
+        self.queue_io(s, 1, deadline)
+
+    # Wakes up the task waiting on sm[idx], brought forward from its deadline
+    # if timed, unless cancelled.
+    def _wake(self, sm, idx):
+        if not sm[3 + idx]:
+            _task_queue.push_head(sm[idx])
+        elif sm[idx].data is None:
+            _task_queue.remove(sm[idx])
+            _task_queue.push_head(sm[idx])
+        sm[idx] = None
+        sm[3 + idx] = False
 
     def remove(self, task):
         while True:
             del_s = None
             for k in self.map:  # Iterate without allocating on the heap
-                q0, q1, s = self.map[k]
+                q0, q1, s, _, _ = self.map[k]
                 if q0 is task or q1 is task:
                     del_s = s
                     break
@@ -115,12 +150,10 @@ class IOQueue:
             # print('poll', s, sm, ev)
             if ev & ~select.POLLOUT and sm[0] is not None:
                 # POLLIN or error
-                _task_queue.push_head(sm[0])
-                sm[0] = None
+                self._wake(sm, 0)
             if ev & ~select.POLLIN and sm[1] is not None:
                 # POLLOUT or error
-                _task_queue.push_head(sm[1])
-                sm[1] = None
+                self._wake(sm, 1)
             if sm[0] is None and sm[1] is None:
                 self._dequeue(s)
             elif sm[0] is None:
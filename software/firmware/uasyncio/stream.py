@@ -4,11 +4,57 @@
 from . import core
 
 
+# Ticks deadline of a timeout in seconds, None if no timeout.
+def _deadline(timeout):
+    return None if timeout is None else core.ticks_add(core.ticks(), int(timeout * 1000))
+
+
+# Waits for a stream to be readable (idx 0) or writable (idx 1), until a ticks
+# deadline if set, then raises TimeoutError. The wake up at the deadline is
+# queued with the io, no task is created. Reused by all the reads or writes of
+# a Stream, so waiting allocates nothing on the heap, as SingletonGenerator.
+class IOWait:
+    def __init__(self, s, idx):
+        self.s = s
+        self.idx = idx
+        self.dl = None
+        self.queued = False
+        self.exc = StopIteration()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.queued:
+            core._io_queue.queue_io(self.s, self.idx, self.dl)
+            self.queued = True
+            return None
+        self.queued = False
+        if self.dl is not None and core._io_queue.dequeue_io(self.s, self.idx):
+            raise core.TimeoutError
+        self.exc.__traceback__ = None
+        raise self.exc
+
+    # Cancelled while waiting.
+    def throw(self, exc, *args):
+        if self.queued and self.dl is not None:
+            core._io_queue.dequeue_io(self.s, self.idx)
+        self.queued = False
+        raise exc
+
+
 class Stream:
-    def __init__(self, s, e={}):
+    def __init__(self, s, e={}, size=0):
         self.s = s
         self.e = e
         self.out_buf = b""
+        self.rwait = IOWait(s, 0)
+        self.wwait = IOWait(s, 1)
+        self.obuf = bytearray(size)  # coalesces small writes until drained
+        self.olen = 0
+        self.writes = 0  # write calls
+        self.wcalls = 0  # writes to the underlying stream
+        self.wbytes = 0  # bytes written to the underlying stream
 
     def get_extra_info(self, v):
         return self.e[v]
@@ -26,14 +72,23 @@ class Stream:
         # TODO yield?
         self.s.close()
 
-    async def read(self, n):
-        yield core._io_queue.queue_read(self.s)
+    # Reads take an optional timeout in seconds, raising TimeoutError as
+    # wait_for but without its task.
+    async def read(self, n, timeout=None):
+        self.rwait.dl = _deadline(timeout)
+        await self.rwait
         return self.s.read(n)
 
-    async def readexactly(self, n):
+    async def readinto(self, buf, timeout=None):
+        self.rwait.dl = _deadline(timeout)
+        await self.rwait
+        return self.s.readinto(buf)
+
+    async def readexactly(self, n, timeout=None):
+        self.rwait.dl = _deadline(timeout)
         r = b""
         while n:
-            yield core._io_queue.queue_read(self.s)
+            await self.rwait
             r2 = self.s.read(n)
             if r2 is not None:
                 if not len(r2):
@@ -42,27 +97,137 @@ class Stream:
                 n -= len(r2)
         return r
 
-    async def readline(self):
+    async def readline(self, timeout=None):
+        self.rwait.dl = _deadline(timeout)
         l = b""
         while True:
-            yield core._io_queue.queue_read(self.s)
+            await self.rwait
             l2 = self.s.readline()  # may do multiple reads but won't block
             l += l2
             if not l2 or l[-1] == 10:  # \n (check l in case l2 is str)
                 return l
 
+    # Reads into buf until full, returns the number of bytes read.
+    async def readexactly_into(self, buf, timeout=None):
+        self.rwait.dl = _deadline(timeout)
+        mv = memoryview(buf)
+        n = 0
+        while n < len(mv):
+            await self.rwait
+            r = self.s.readinto(mv[n:])
+            if r is not None:
+                if not r:
+                    raise EOFError
+                n += r
+        return n
+
+    # Reads a line into buf, returns the number of bytes read, \n included.
+    # Stops when buf is full, the rest of a longer line is left to the next
+    # call. Streams without readlineinto are read with readline, a line not
+    # fitting buf is dropped up to its end and -1 returned, the next call
+    # reads the next line.
+    async def readline_into(self, buf, timeout=None):
+        self.rwait.dl = _deadline(timeout)
+        mv = memoryview(buf)
+        n = 0
+        drop = False
+        while n < len(mv):
+            await self.rwait
+            if hasattr(self.s, "readlineinto"):
+                r = self.s.readlineinto(mv[n:])  # won't block
+                if r is None:
+                    continue
+            else:
+                l = self.s.readline()
+                if l is None:
+                    continue
+                r = len(l)
+                if drop or n + r > len(mv) or n + r == len(mv) and l[-1] != 10:
+                    # No room left for the \n.
+                    if not r or l[-1] == 10:
+                        return -1
+                    drop = True
+                    continue
+                mv[n : n + r] = l
+            if not r:
+                break
+            n += r
+            if mv[n - 1] == 10:  # \n
+                break
+        return n
+
+    def _write(self, buf):
+        ret = self.s.write(buf)
+        self.wcalls += 1
+        if ret:
+            self.wbytes += ret
+        return ret
+
     def write(self, buf):
+        self.writes += 1
+        if isinstance(buf, str):
+            buf = buf.encode()
+        if not self.out_buf:
+            n = len(buf)
+            if self.olen + n <= len(self.obuf):
+                # Small write, copied to be sent with the others on drain.
+                self.obuf[self.olen : self.olen + n] = buf
+                self.olen += n
+                return
+            if not self.olen:
+                # Try to write immediately to the underlying stream, saves copying buf.
+                ret = self._write(buf)
+                if ret == n:
+                    return
+                if ret is not None:
+                    buf = buf[ret:]
         self.out_buf += buf
 
-    async def drain(self):
-        mv = memoryview(self.out_buf)
+    # Waits on the poller for the unsent rest only, until the deadline of
+    # wwait. Pending data is dropped on timeout, a retry would send it twice.
+    async def _drain(self, mv):
         off = 0
-        while off < len(mv):
-            yield core._io_queue.queue_write(self.s)
-            ret = self.s.write(mv[off:])
+        while True:
+            ret = self._write(mv[off:])
             if ret is not None:
                 off += ret
-        self.out_buf = b""
+            if off >= len(mv):
+                return
+            try:
+                await self.wwait
+            except core.TimeoutError:
+                self.olen = 0
+                self.out_buf = b""
+                raise
+
+    # Writes take an optional timeout in seconds as reads.
+    async def drain(self, timeout=None):
+        self.wwait.dl = _deadline(timeout)
+        await self._flush()
+
+    async def _flush(self):
+        if self.olen:
+            await self._drain(memoryview(self.obuf)[: self.olen])
+            self.olen = 0
+        if self.out_buf:
+            await self._drain(memoryview(self.out_buf))
+            self.out_buf = b""
+
+    # Writes the passed buffers in order with no concatenation, the ones
+    # fitting the output buffer are coalesced.
+    async def awritev(self, bufs, timeout=None):
+        self.wwait.dl = _deadline(timeout)
+        for buf in bufs:
+            if isinstance(buf, str):
+                buf = buf.encode()
+            if self.olen + len(buf) > len(self.obuf):
+                await self._flush()
+            if len(buf) > len(self.obuf):
+                self.writes += 1
+                await self._drain(memoryview(buf))
+            else:
+                self.write(buf)
+        await self._flush()
 
 
 # Stream can be used for both reading and writing to save code size
@@ -143,14 +308,14 @@ async def start_server(cb, host, port, backlog=5):
 # Legacy uasyncio compatibility
 
 
-async def stream_awrite(self, buf, off=0, sz=-1):
+async def stream_awrite(self, buf, off=0, sz=-1, timeout=None):
     if off != 0 or sz != -1:
         buf = memoryview(buf)
         if sz == -1:
             sz = len(buf)
         buf = buf[off : off + sz]
     self.write(buf)
-    await self.drain()
+    await self.drain(timeout)
 
 
 Stream.aclose = Stream.wait_closed
@@ -12,13 +12,15 @@ import machine
 import pyb
 import session
 import menu
-from tools.utils import iso8601, scheduling, alert, log, welcome_msg, blink, msg, timesync, disconnect, trigger
+from tools.utils import iso8601, scheduling, alert, log, welcome_msg, blink, msg, timesync, disconnect, trigger, flusher, sink, bsink, recover
 from configs import dfl, cfg
 
 devs = []
 
 # Restarts the system.
 async def restart():
+    sink.close()  # Writes out buffered data.
+    bsink.close()
     machine.reset()
 
 # Forces garbage collection.
@@ -134,10 +136,12 @@ async def main():
 ############################ Program starts here ###############################
 log(dfl.RESET_CAUSE[machine.reset_cause()], type='e')
 welcome_msg()
+recover()  # Restores data lost on unclean shutdown.
 asyncio.create_task(blink(4, 1, 2000, stop_evt=timesync))  # Blue, no gps fix.
 asyncio.create_task(blink(3, 100, 1000, cancel_evt=scheduling))  # Yellow, initialisation.
 asyncio.create_task(blink(2, 1, 2000, start_evt=timesync))  # Green, operating.
 asyncio.create_task(cleaner())
+asyncio.create_task(flusher())
 asyncio.create_task(listner(trigger))
 asyncio.create_task(alerter(alert))
 
@@ -147,4 +151,6 @@ try:
 except KeyboardInterrupt:
     pass
 finally:
+    sink.close()  # Writes out buffered data.
+    bsink.close()
     asyncio.new_event_loop()  # Clear retained state.
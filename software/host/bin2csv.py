@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# bin2csv.py
+# MIT license; Copyright (c) 2021 Andrea Corbo
+#
+# Converts binary daily data files (YYYYMMDD.bin) back to csv data lines.
+# Usage: python3 bin2csv.py [-o out.csv] YYYYMMDD.bin [...]
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'firmware'))
+
+import tools.record as record
+
+def convert(file, out, separator=','):
+    with open(file, 'rb') as f:
+        buf = f.read()
+    n = 0
+    for name, epoch, fields, tail in record.records(buf):
+        out.write(record.csv(name, epoch, fields, tail, separator) + '\r\n')
+        n += 1
+    return n
+
+def main():
+    parser = argparse.ArgumentParser(description='Converts binary data files to csv.')
+    parser.add_argument('files', nargs='+', help='binary data files')
+    parser.add_argument('-o', '--output', help='output file, default stdout')
+    parser.add_argument('-s', '--separator', default=',', help='csv data separator')
+    args = parser.parse_args()
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        for file in args.files:
+            n = convert(file, out, args.separator)
+            print('{}: {} records'.format(file, n), file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# compat.py
+# MIT license; Copyright (c) 2021 Andrea Corbo
+#
+# Lets host scripts import the firmware modules under CPython.
+# Maps uasyncio on asyncio and stubs out the board only modules, must be
+# imported before any firmware module.
+
+import asyncio
+import os
+import sys
+import time
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, '..', 'firmware'), os.path.join(HERE, '..', 'flash')]
+
+uasyncio = types.ModuleType('uasyncio')
+for k in dir(asyncio):
+    if not k.startswith('__'):
+        setattr(uasyncio, k, getattr(asyncio, k))
+uasyncio.sleep_ms = lambda ms: asyncio.sleep(ms / 1000)
+sys.modules['uasyncio'] = uasyncio
+
+sys.modules['pyb'] = types.ModuleType('pyb')
+
+time.ticks_ms = lambda: int(time.monotonic() * 1000)
+time.ticks_diff = lambda new, old: new - old
+_mktime = time.mktime
+time.mktime = lambda t: _mktime(tuple(t) + (-1,) * (9 - len(t)))  # Takes 8-tuples as micropython.
+
+# primitives.message relies on micropython generator based awaitables.
+class Message:
+
+    def __init__(self, delay_ms=0):
+        self.delay_ms = delay_ms
+        self.clear()
+
+    def clear(self):
+        self._flag = False
+        self._data = None
+
+    async def wait(self):
+        while not self._flag:
+            await asyncio.sleep(self.delay_ms / 1000)
+
+    def __await__(self):
+        return self.wait().__await__()
+
+    def is_set(self):
+        return self._flag
+
+    def set(self, data=None):
+        self._flag = True
+        self._data = data
+
+    def value(self):
+        return self._data
+
+message = types.ModuleType('primitives.message')
+message.Message = Message
+sys.modules['primitives.message'] = message
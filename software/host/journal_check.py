@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# journal_check.py
+# MIT license; Copyright (c) 2021 Andrea Corbo
+#
+# Crash recovery check of the journaled data sink. Writes records, drops the
+# sink without closing it as an unclean shutdown would, then recovers at boot
+# as main.py does and compares the data file with the records written.
+# Covers torn journal tails, corrupted file tails, files archived meanwhile and
+# files shorter than their journal, whose journal must be set aside and never
+# overwritten by the reopened sink.
+# Usage: python3 journal_check.py
+
+import os
+import tempfile
+
+import compat
+from configs import dfl, cfg
+import tools.utils as utils
+from tools.sink import SINK
+
+utils.logger = False
+cfg.LOG_TO_FILE = False
+
+RECS = [('$X,{},{}\r\n'.format(i, 'z' * (i % 97))).encode() for i in range(400)]
+DAY = '20210101'
+
+def path(f):
+    return dfl.DATA_DIR + '/' + f
+
+def read(f):
+    with open(path(f), 'rb') as d:
+        return d.read()
+
+def crash(k, start=0):
+    s = SINK(dfl.DATA_DIR, lambda: DAY, journal=True)
+    for r in RECS[start:k]:
+        s.put(r)
+    return s  # Never closed.
+
+def clean():
+    for f in os.listdir(dfl.DATA_DIR):
+        os.remove(path(f))
+
+def check(name, ok):
+    print('{:<12} {}'.format(name, 'ok' if ok else 'FAILED'))
+    return ok
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        dfl.DATA_DIR = tmp
+        res = []
+        # Buffered data lost.
+        crash(123)
+        utils.recover()
+        res.append(check('buffered', read(DAY) == b''.join(RECS[:123]) and os.listdir(tmp) == [DAY]))
+        clean()
+        # File tail not matching the journal.
+        s = crash(200)
+        s.f.write(bytes(s.buf[s.head:s.head + s.cnt])[:100] + b'#' * 30)
+        s.f.flush()
+        utils.recover()
+        res.append(check('corrupted', read(DAY) == b''.join(RECS[:200])))
+        clean()
+        # Last journal entry torn.
+        s = crash(150)
+        s.jrn.seek(s.jpos - 5)
+        s.jrn.write(b'\xff' * 5)
+        s.jrn.flush()
+        utils.recover()
+        res.append(check('torn', read(DAY) == b''.join(RECS[:149])))
+        clean()
+        # Archived meanwhile.
+        crash(100)
+        os.rename(path(DAY), path(dfl.SENT_FILE_PFX + DAY))
+        utils.recover()
+        res.append(check('archived', read(dfl.SENT_FILE_PFX + DAY) == b''.join(RECS[:100])
+            and not os.path.exists(path(DAY))))
+        clean()
+        # File lost, the journal starts past its end, set aside and kept.
+        crash(300).close()
+        crash(320, 300)
+        os.remove(path(DAY))
+        jrn = read(DAY + dfl.JOURNAL_FILE_SFX)
+        utils.recover()
+        bad = DAY + dfl.JOURNAL_FILE_SFX + dfl.BAD_FILE_SFX
+        ok = read(bad) == jrn and not os.path.exists(path(DAY + dfl.JOURNAL_FILE_SFX))
+        s = crash(340, 320)  # Reopened the same day, crashes again.
+        ok = ok and read(bad) == jrn
+        utils.recover()
+        ok = ok and read(bad) == jrn and read(DAY) == b''.join(RECS[320:340])
+        res.append(check('gap', ok))
+        print('ALL', 'ok' if all(res) else 'FAILED')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# ymodem_bench.py
+# MIT license; Copyright (c) 2021 Andrea Corbo
+#
+# Benchmark of the buoy ymodem, asend and arecv of tools/ymodem.py against
+# reference peers over the simulated serial link of ymodemw_loop.py.
+# Reports per run the effective throughput, the link usage, the retries and
+# the process cpu time per transferred kB, peers and link included, so runs
+# are comparable on the same host only.
+# Usage: python3 ymodem_bench.py [-d send recv] [-l 0 0.5] [-w 1 8]
+#   [-e 0.02] [-y 1e-3] [-z] [-a] [-f] [-n 3] [file]
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from ymodemw_loop import Link, Receiver, sample
+import tools.crc as crc
+from tools.ymodem import YMODEM, SOH, STX, EOT, ACK, NAK, CAN, C
+from tools.ymodemw import YMODEMW, SYN
+
+# Reference sender, stop and wait with 1k packets and 16 bit crc.
+class Sender:
+
+    def __init__(self, rx, tx, retry=10, timeout=10):
+        self.rx = rx
+        self.tx = tx
+        self.retry = retry
+        self.timeout = timeout
+        self.resent = 0  # Packets sent again.
+        self.naks = 0  # Naks received.
+        self.timeouts = 0  # Replies timed out.
+        self.done = None  # Time the end of the batch got acked.
+
+    async def wait(self, *chars):
+        while True:
+            c = await self.rx.read(1, self.timeout)
+            if not c or c in chars or c == CAN:
+                return c
+
+    # Sends a packet until acked, ack is followed by C for file name packets.
+    async def packet(self, seq, data):
+        sz = 128 if len(data) <= 128 else 1024
+        data = data.ljust(sz, b'\x1a' if seq else b'\x00')
+        pkt = (SOH if sz == 128 else STX) + bytes([seq, 0xff - seq]) + data + crc.crc16(data).to_bytes(2, 'big')
+        for i in range(self.retry):
+            if i:
+                self.resent += 1
+            await self.tx.write(pkt)
+            c = await self.wait(ACK, NAK)
+            if c == ACK:
+                return True
+            if c == NAK:
+                self.naks += 1
+            elif not c:
+                self.timeouts += 1
+            else:
+                return False  # Canceled.
+        return False
+
+    async def send(self, files):
+        if await self.wait(C) != C:
+            return False
+        for name, data in files:
+            if not await self.packet(0, '{}\x00{} {:o}'.format(name, len(data), int(time.time())).encode()):
+                return False
+            if await self.wait(C) != C:
+                return False
+            for i in range(0, len(data), 1024):
+                if not await self.packet((i // 1024 + 1) % 0x100, data[i:i + 1024]):
+                    return False
+            for i in range(self.retry):
+                await self.tx.write(EOT)
+                if await self.wait(ACK, NAK) == ACK:
+                    break
+            else:
+                return False
+            if await self.wait(C) != C:
+                return False
+        if not await self.packet(0, b''):
+            return False
+        self.done = time.time()
+        return True
+
+# Sends the passed files from the buoy to the reference receiver.
+async def send(paths, window, latency, args, end):
+    up = Link(args.baud, latency, args.per, args.scale, bre=args.bre)
+    down = Link(args.baud, latency, args.per, args.scale)
+    tx = YMODEMW(down.read, up.write, timeout=max(1, 20 * args.scale), adaptive=args.adaptive)
+    rx = Receiver(up, down, window, args.fec)
+    task = asyncio.create_task(rx.run())
+    if await down.read(1) != SYN or not await tx.negotiate(window, args.fec, compress=args.compress):
+        return None
+    ok = await tx.asend(paths + ['\x00'])
+    if not ok:
+        task.cancel()  # Receiver would wait forever.
+        return None
+    await task
+    for path in paths:
+        with open(path, 'rb') as f:
+            ok = ok and rx.files.get(os.path.basename(path)) == f.read()
+    return ok, tx.stats.resent, tx.stats.naks, tx.stats.timeouts, up.errors
+
+# Sends the passed files from the reference sender to the buoy.
+async def recv(paths, window, latency, args, end):
+    up = Link(args.baud, latency, args.per, args.scale)
+    down = Link(args.baud, latency, args.per, args.scale, bre=args.bre)
+    rx = YMODEM(down.read, up.write, timeout=max(1, 20 * args.scale))
+    tx = Sender(up, down, timeout=max(1, 20 * args.scale))
+    files = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            files.append((path + '.rx', f.read()))
+    task = asyncio.create_task(tx.send(files))
+    ok = await rx.arecv()
+    ok = ok and await task
+    end[0] = tx.done  # Leaves out the final pause of the receiver.
+    for name, data in files:
+        try:
+            with open(name, 'rb') as f:
+                ok = ok and f.read() == data
+            os.remove(name)
+        except OSError:
+            ok = False
+    return ok, tx.resent, tx.naks, tx.timeouts, down.errors
+
+# Runs a transfer, returns result, simulated time and process time.
+def run(direction, paths, window, latency, args):
+    random.seed(2)
+    for f in os.listdir(os.path.dirname(paths[0])):
+        if f.startswith('$'):
+            os.remove(os.path.join(os.path.dirname(paths[0]), f))  # Restarts from scratch.
+    end = [None]  # End of the transfer if before returning.
+    t = time.time()
+    cpu = time.process_time()
+    res = asyncio.run((send if direction == 'send' else recv)(paths, window if window > 1 else 0, latency, args, end))
+    return res, ((end[0] or time.time()) - t) / args.scale, time.process_time() - cpu
+
+def main():
+    parser = argparse.ArgumentParser(description='Ymodem benchmark over a simulated serial link.')
+    parser.add_argument('file', nargs='?', help='file to transfer, default a synthetic data file')
+    parser.add_argument('-d', '--direction', nargs='+', default=['send', 'recv'], choices=['send', 'recv'],
+        help='send is buoy to remote, recv remote to buoy')
+    parser.add_argument('-l', '--latency', type=float, nargs='+', default=[0, 0.5], help='one way latencies [s]')
+    parser.add_argument('-w', '--window', type=int, nargs='+', default=[1, 8], help='send windows, 1 is stop and wait')
+    parser.add_argument('-e', '--per', type=float, default=0, help='error rate of 1k packets')
+    parser.add_argument('-y', '--bre', type=float, default=0, help='byte error rate of data packets')
+    parser.add_argument('-b', '--baud', type=int, default=9600)
+    parser.add_argument('-s', '--scale', type=float, default=0.2, help='simulated time scale')
+    parser.add_argument('-z', '--compress', action='store_true')
+    parser.add_argument('-a', '--adaptive', action='store_true', help='adapts packet size and reply timeout')
+    parser.add_argument('-f', '--fec', action='store_true', help='corrects errors')
+    parser.add_argument('-n', '--runs', type=int, default=1, help='runs averaged')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        data = open(args.file, 'rb').read() if args.file else sample(32768)
+        paths = [os.path.join(tmp, '20210101')]
+        with open(paths[0], 'wb') as f:
+            f.write(data)
+        print('{} bytes, {} baud, packet error rate {}, byte error rate {}{}{}{}'.format(len(data), args.baud,
+            args.per, args.bre, ', compressed' if args.compress else '', ', adaptive' if args.adaptive else '',
+            ', fec' if args.fec else ''))
+        print('{:>4} {:>7} {:>6} {:>7} {:>7} {:>5} {:>6} {:>5} {:>5} {:>6} {:>7}'.format('dir', 'latency', 'window',
+            'time', 'B/s', 'link', 'errors', 'resnt', 'naks', 'touts', 'cpu/kB'))
+        for direction in args.direction:
+            for latency in args.latency:
+                for window in args.window if direction == 'send' else [1]:
+                    runs = [run(direction, paths, window, latency, args) for _ in range(args.runs)]
+                    if not all(r[0] and r[0][0] for r in runs):
+                        print('{:>4} {:7.2f} {:6d} FAILED'.format(direction, latency, window))
+                        continue
+                    t = sum(r[1] for r in runs) / len(runs)
+                    cpu = sum(r[2] for r in runs) / len(runs)
+                    avg = [sum(r[0][i] for r in runs) / len(runs) for i in range(1, 5)]
+                    bps = len(data) / t
+                    print('{:>4} {:7.2f} {:6d} {:7.1f} {:7.1f} {:4.0f}% {:6.1f} {:5.1f} {:5.1f} {:6.1f} {:5.1f}ms'.format(
+                        direction, latency, window, t, bps, bps * 1000 / args.baud, avg[3], avg[0], avg[1], avg[2],
+                        cpu * 1000 / (len(data) / 1024)))
+
+if __name__ == '__main__':
+    main()
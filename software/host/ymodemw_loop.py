@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# ymodemw_loop.py
+# MIT license; Copyright (c) 2021 Andrea Corbo
+#
+# Loopback throughput test of the buoy ymodem sender, stop and wait against
+# windowed, over a simulated serial link with latency, packet and bit errors.
+# Receiver is the reference implementation of the remote side of the windowed
+# mode and of the error correction described in tools/ymodemw.py, and unpacks
+# bundles described in tools/bundle.py. As a stock remote it announces neither
+# compression nor bundling and stores files as received.
+# Usage: python3 ymodemw_loop.py [-l 0 0.25 0.5 1] [-w 1 4 8] [-e 0.02]
+#   [-r 1e-4] [-f] [-m 10 [-k]] [-t] [file]
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import tempfile
+import time
+import zlib
+
+import compat
+import tools.utils as utils
+import tools.crc as crc
+import tools.rs as rs
+from tools.ymodem import SOH, STX, EOT, ACK, NAK, C, ZFLAG
+from tools.ymodemw import YMODEMW, SYN, FEC, ZIP, BDL, WIN
+from tools.bundle import BFLAG
+
+utils.logger = False
+
+# One way of a serial link, writes block for the wire time, data gets
+# delivered after the latency and whole packets get corrupted at random, as
+# likely as longer they are, or get bits flipped at the bit error rate, or
+# bytes replaced at the byte error rate. Control bytes go through clean.
+class Link:
+
+    def __init__(self, baud, latency, per, scale, ber=0, bre=0):
+        self.rate = baud / 10 / scale  # Bytes per second.
+        self.latency = latency * scale
+        self.per = per
+        self.ber = ber
+        self.bre = bre
+        self.errors = 0  # Corrupted writes.
+        self.buf = bytearray()
+        self.free = 0  # Time the wire gets free.
+        self.event = asyncio.Event()
+
+    def _deliver(self, data):
+        self.buf.extend(data)
+        self.event.set()
+
+    async def write(self, data, timeout=None):
+        if isinstance(data, tuple):
+            data = b''.join(data)  # Vectored write.
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        self.free = max(now, self.free) + len(data) / self.rate
+        data = bytearray(data)
+        sent = bytes(data)
+        if len(data) > 128 and random.random() < 1 - (1 - self.per) ** (len(data) / 1029):
+            data[len(data) // 2] ^= 0xff
+        if len(data) > 128 and self.ber:
+            for i in skips(self.ber, len(data) * 8):
+                data[i // 8] ^= 1 << i % 8
+        if len(data) > 128 and self.bre:
+            for i in skips(self.bre, len(data)):
+                data[i] ^= random.randrange(1, 0x100)
+        self.errors += data != sent
+        await asyncio.sleep(self.free - now)
+        loop.call_later(self.latency, self._deliver, data)
+        return len(data)
+
+    async def read(self, n, timeout=10):
+        loop = asyncio.get_running_loop()
+        end = loop.time() + timeout
+        while len(self.buf) < n:
+            self.event.clear()
+            try:
+                await asyncio.wait_for(self.event.wait(), end - loop.time())
+            except (asyncio.TimeoutError, ValueError):
+                break
+        data = bytes(self.buf[:n])
+        del self.buf[:n]
+        return data
+
+# Positions hit at the passed rate out of n, skipping to the next one.
+def skips(rate, n):
+    i = -1
+    while True:
+        i += 1 + int(math.log(1 - random.random()) / math.log(1 - rate))
+        if i >= n:
+            return
+        yield i
+
+# Remote side, receives files into a dict.
+class Receiver:
+
+    def __init__(self, rx, tx, window, fec=False, caps=ZIP | BDL):
+        self.rx = rx
+        self.tx = tx
+        self.window = window
+        self.fec = fec
+        self.caps = caps  # Compression and bundling bits.
+        self.files = {}
+        self.repaired = 0  # Packets repaired.
+
+    # Gets a packet, data packets carry parity if correcting errors.
+    async def packet(self, par=False):
+        while True:
+            c = await self.rx.read(1)
+            if not c:
+                return None, None
+            if c == EOT:
+                return EOT, None
+            if c in (SOH, STX):
+                break
+        sz = 128 if c == SOH else 1024
+        hdr = await self.rx.read(2)
+        data = await self.rx.read(sz + 2)
+        if len(hdr) < 2 or len(data) < sz + 2:
+            return False, None
+        ok = lambda: hdr[0] == 0xff - hdr[1] and crc.crc16(data[:-2]) == (data[-2] << 8) + data[-1]
+        if par and self.fec:
+            parity = await self.rx.read(rs.size(2 + sz + 2))
+            if not ok():
+                buf = bytearray(hdr + data)
+                if rs.repair(buf, parity) > 0:
+                    hdr, data = buf[:2], buf[2:]
+                    if ok():
+                        self.repaired += 1
+        if hdr[0] != 0xff - hdr[1]:
+            return False, None
+        if not ok():
+            return hdr[0], None
+        return hdr[0], data[:-2]
+
+    async def run(self):
+        if self.window or self.fec or self.caps:
+            await self.tx.write(SYN + bytes([self.window | (FEC if self.fec else 0) | self.caps]))
+            reply = await self.rx.read(2)
+            self.window = reply[1] & WIN
+            self.fec = bool(reply[1] & FEC)
+            self.caps = reply[1] & (ZIP | BDL)  # Flags not granted are ignored.
+        await self.tx.write(C)
+        while True:
+            seq, data = await self.packet()
+            if seq != 0:
+                continue
+            if data is None:
+                await self.tx.write(NAK)  # File name packets are resent on reply only.
+                continue
+            fields = bytes(data).rstrip(b'\x00').split(b'\x00')
+            if not fields[0]:
+                await self.tx.write(ACK)
+                return True
+            name = fields[0].decode()
+            info = fields[1].decode().split(' ')
+            length, z = int(info[0]), ZFLAG in info[2:] and self.caps & ZIP
+            await self.tx.write(ACK)
+            await self.tx.write(C)
+            data = await self.recv_data(length, z)
+            if BFLAG in info[2:] and self.caps & BDL:
+                self.unbundle(data)
+            else:
+                self.files[name] = data
+
+    # Places the members of a bundle at their offsets, a partial bundle is
+    # good up to its last byte.
+    def unbundle(self, data):
+        man, _, body = data.partition(b'\n\n')
+        pos = 0
+        for line in man.decode().split('\n'):
+            name, off, length, _ = line.split(' ')
+            off, length = int(off), int(length)
+            f = bytearray(self.files.get(name, b''))
+            f[off:off + length] = body[pos:pos + length]
+            self.files[name] = bytes(f)
+            pos += length
+
+    async def recv_data(self, length, z):
+        out = bytearray()
+        buf = {}  # Received out of sequence.
+        expected = 1
+        while True:
+            seq, data = await self.packet(True)
+            if seq is EOT:
+                await self.tx.write(ACK)
+                await self.tx.write(C)
+                return bytes(out[:length])
+            if seq is None:
+                continue  # Timeout, sender resends.
+            if data is None:
+                if seq is not False:
+                    await self.tx.write(NAK + bytes([seq]) if self.window > 1 else NAK)
+                continue
+            if self.window > 1:
+                await self.tx.write(ACK + bytes([seq]))
+            else:
+                await self.tx.write(ACK)
+            ahead = (seq - expected) % 0x100
+            if ahead >= 0x80:
+                continue  # Duplicated packet.
+            buf[seq] = data
+            while expected in buf:
+                data = buf.pop(expected)
+                if z:
+                    n = int.from_bytes(data[:2], 'little')
+                    data = zlib.decompress(bytes(data[2:2 + n]), -15)
+                out.extend(data)
+                expected = (expected + 1) % 0x100
+
+async def transfer(paths, window, latency, args):
+    scale = args.scale
+    up = Link(args.baud, latency, args.per, scale, args.ber)
+    down = Link(args.baud, latency, args.per, scale)
+    tx = YMODEMW(down.read, up.write, timeout=max(1, 20 * scale), adaptive=args.adaptive)
+    rx = Receiver(up, down, window, args.fec, 0 if args.stock else ZIP | BDL)
+    task = asyncio.create_task(rx.run())
+    t = time.time()
+    if window or args.fec or not args.stock:
+        if await down.read(1) != SYN or not await tx.negotiate(window, args.fec, compress=args.compress,
+                bundle=args.bundle):
+            return None
+    else:
+        tx.plain()  # Remote replied ACK to the preamble.
+    ok = await tx.asend(paths + ['\x00'])
+    if not ok:
+        task.cancel()  # Receiver would wait forever.
+        return None
+    await task
+    t = (time.time() - t) / scale
+    for path in paths:
+        with open(path, 'rb') as f:
+            ok = ok and rx.files.get(os.path.basename(path)) == f.read()
+    return ok, t, tx.stats, rx.repaired
+
+def sample(size):
+    random.seed(1)
+    lines = []
+    while sum(map(len, lines)) < size:
+        i = len(lines)
+        lines.append('$YOUNG,{},{:.2f},{:.2f},{:.2f},{:.2f}\r\n'.format(1609459200 + i * 600,
+            random.random() * 360, random.random() * 20, 15 + random.random(), 1013 + random.random()))
+    return ''.join(lines).encode()
+
+def main():
+    parser = argparse.ArgumentParser(description='Ymodem windowed mode loopback test.')
+    parser.add_argument('file', nargs='?', help='file to send, default a synthetic data file')
+    parser.add_argument('-l', '--latency', type=float, nargs='+', default=[0, 0.25, 0.5, 1], help='one way latencies [s]')
+    parser.add_argument('-w', '--window', type=int, nargs='+', default=[1, 4, 8], help='windows, 1 is stop and wait')
+    parser.add_argument('-e', '--per', type=float, default=0, help='error rate of 1k packets')
+    parser.add_argument('-b', '--baud', type=int, default=9600)
+    parser.add_argument('-s', '--scale', type=float, default=0.2, help='simulated time scale')
+    parser.add_argument('-z', '--compress', action='store_true')
+    parser.add_argument('-a', '--adaptive', action='store_true', help='adapts packet size and reply timeout')
+    parser.add_argument('-r', '--ber', type=float, default=0, help='bit error rate of data packets')
+    parser.add_argument('-f', '--fec', action='store_true', help='corrects errors')
+    parser.add_argument('-m', '--members', type=int, default=1, help='splits the data in daily files')
+    parser.add_argument('-k', '--bundle', action='store_true', help='sends the daily files in a bundle')
+    parser.add_argument('-t', '--stock', action='store_true', help='remote inflating and unpacking nothing')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        data = open(args.file, 'rb').read() if args.file else sample(32768)
+        size = len(data)
+        paths = []
+        for i in range(args.members):
+            paths.append(os.path.join(tmp, '202101{:02d}'.format(i + 1)))
+            with open(paths[-1], 'wb') as f:
+                f.write(data[i * size // args.members:(i + 1) * size // args.members])
+        print('{} bytes in {} files{}, {} baud, packet error rate {}, bit error rate {}{}{}'.format(size,
+            args.members, ', bundled' if args.bundle else '', args.baud, args.per, args.ber,
+            ', fec' if args.fec else '', ', stock remote' if args.stock else ''))
+        print('{:>8} {:>6} {:>8} {:>8} {:>6} {:>6} {:>6} {:>6}'.format('latency', 'window', 'time', 'B/s', 'link',
+            'resent', 'naks', 'fixed'))
+        for latency in args.latency:
+            for window in args.window:
+                for f in os.listdir(tmp):
+                    if f.startswith('$'):
+                        os.remove(os.path.join(tmp, f))  # Restarts from scratch.
+                random.seed(2)
+                res = asyncio.run(transfer(paths, window if window > 1 else 0, latency, args))
+                if not res or not res[0]:
+                    print('{:8.2f} {:6d} FAILED'.format(latency, window))
+                    continue
+                bps = size / res[1]
+                print('{:8.2f} {:6d} {:8.1f} {:8.1f} {:5.0f}% {:6d} {:6d} {:6d}'.format(latency, window, res[1], bps,
+                    bps * 1000 / args.baud, res[2].resent, res[2].naks, res[3]))
+
+if __name__ == '__main__':
+    main()